@@ -0,0 +1,220 @@
+###### DESCRIPTION #################################################
+### Renders weather cards in bulk from the command line, no Discord needed. Reads a JSONL file where every line is either
+### a weatherapi.com / wttr.in JSON payload, a city name, or an object like {"city": "Cologne", "data": {...}}, renders the
+### requested cards with the pill functions across a pool of worker processes (the same workers the bot uses), writes them
+### to a directory and reports the throughput and the time spent in each stage. City names are fetched from weatherapi.com,
+### or from the local stub server with --stub, so it doubles as an offline load test and performance regression run.
+###
+###     python batch_render.py cities.jsonl -o cards/                               # pre-generating cards
+###     python batch_render.py benchmarks/fixtures/cities.jsonl --stub --repeat 20 --no-write -j 8 --report run.json
+###     echo '"Cologne"' | python batch_render.py - --stub --cards hourly,3_days
+
+
+###### IMPORTS #################################################
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed                                        # the worker processes
+import json
+import os
+import sys
+import time
+
+import encoders                                                                                         # the encoding the cards are saved in
+import gazetteer                                                                                        # file names and city names from the payloads
+import metrics                                                                                          # the stage timings of the workers
+import pill
+import providers                                                                                        # pointed at the stub server with --stub
+import render_pool                                                                                      # the workers render exactly like the bot's render pool
+import weather_report                                                                                   # fetching and parsing the payloads
+
+
+###### CONSTANTS #################################################
+# Card name -> (pill function, function parsing (city, forecast_model.Forecast) into its arguments, days of forecast needed)
+# The cards that show the time are pinned to the payload's, so the same input always renders the same cards
+CARDS = {
+    'hourly':           (pill.create_weather_card_hourly,   lambda city, forecast: weather_report.parse_weather_report(city, forecast, weather_report.get_payload_time(city, forecast)), 3),
+    'tomorrow':         (pill.create_tomorrow_forecast,     lambda city, forecast: weather_report.parse_tomorrow(city, forecast, False),        3),
+    'tomorrow_dark':    (pill.create_tomorrow_forecast,     lambda city, forecast: weather_report.parse_tomorrow(city, forecast, True),         3),
+    '3_days':           (pill.create_multiday_forecast,     lambda city, forecast: weather_report.parse_forecast_days(city, forecast, 3, False), 3),
+    '7_days':           (pill.create_multiday_forecast,     lambda city, forecast: weather_report.parse_forecast_days(city, forecast, 7, False), 7),
+    'simplified':       (pill.create_weather_card_simplified, lambda city, forecast: weather_report.parse_simplified(city, forecast, weather_report.get_payload_time(city, forecast)), 1),
+}
+DEFAULT_CARDS = ['hourly', 'tomorrow']
+WORKERS = render_pool.RENDER_WORKERS
+
+
+###### INPUT #################################################
+def read_jobs(lines) -> list:
+    '''
+    Reads the JSONL input -> [(city, provider, Forecast or None)], provider being 'weatherapi' or 'wttr'.
+    The payloads are read into a forecast_model.Forecast right away, so only one is kept per job.
+    '''
+    jobs = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+
+        item = json.loads(line)
+        if isinstance(item, str):                                                                       # just a city name
+            jobs.append((item, 'weatherapi', None))
+            continue
+
+        data = item.get('data', item)
+        city = item.get('city')
+
+        if 'forecast' in data:                                                                          # weatherapi.com
+            forecast = weather_report.read_forecast(data)
+            jobs.append((city or forecast.name, 'weatherapi', forecast))
+        elif 'current_condition' in data:                                                               # wttr.in (format=j1)
+            forecast = weather_report.read_forecast(data)
+            jobs.append((city or forecast.name, 'wttr', forecast))
+        elif city:
+            jobs.append((city, 'weatherapi', None))
+        else:
+            raise ValueError(f'line {number}: not a city name or a weatherapi.com / wttr.in payload')
+
+    return jobs
+
+# Fetches the forecasts of the jobs that only have a city name
+def fetch_missing(jobs:list, days:int) -> list:
+    fetched = []
+    for city, provider, data in jobs:
+        if data is None:
+            data = weather_report.get_forecast(city, days)                                              # timed as fetch and parse in there
+        fetched.append((city, provider, data))
+
+    return fetched
+
+
+###### RENDERING #################################################
+def render_all(jobs:list, cards:list, encoding, workers:int, out:str=None, repeat:int=1) -> dict:
+    '''
+    Renders every card of every job in the worker processes and returns the run's stats.
+    A card that fails to render doesn't stop the others, the failures are counted by city with the last error.
+
+    jobs: [(city, provider, Forecast)], see read_jobs()
+    cards: names of the CARDS to render for every job (the ones needing more days than a forecast has are skipped)
+    encoding: encoders.Encoding to save the cards as
+    workers: number of worker processes
+    out: directory to write the cards to, None to throw them away
+    repeat: how many times to render everything, for load tests
+    '''
+    tasks = []
+    skipped = 0
+    for city, provider, forecast in jobs:
+        city = gazetteer.canonical(city)
+        for card in cards:
+            func, parse, days = CARDS[card]
+            if len(forecast.days) < days:                                                               # like a week from wttr.in, which only has 3 days
+                skipped += 1
+                continue
+
+            with metrics.stage('parse'):
+                args = parse(city, forecast)
+            tasks.append((city, f'{gazetteer.location_key(city).replace(" ", "_")}_{card}', func, args))
+
+    if out:
+        os.makedirs(out, exist_ok=True)
+
+    total_bytes = 0
+    rendered = 0
+    failed = {}                                                                                         # city -> {'cards': how many failed, 'error': the last one}
+    with ProcessPoolExecutor(max_workers=workers, initializer=render_pool._init_worker) as pool:
+        for warming in [pool.submit(render_pool._warm) for _ in range(workers)]:                        # the workers load their assets before the clock starts
+            warming.result()
+
+        start = time.perf_counter()
+        futures = {pool.submit(render_pool._render, func, args, encoding): (city, name)
+                   for _ in range(repeat) for city, name, func, args in tasks}
+
+        for future in as_completed(futures):
+            city, name = futures[future]
+            try:
+                png, timings = future.result()
+            except Exception as e:                                                                      # like a condition without its big icon, the rest of the batch carries on
+                failure = failed.setdefault(city, {'cards': 0, 'error': None})
+                failure['cards'] += 1
+                failure['error'] = f'{name}: {e!r}'
+                continue
+
+            metrics.record_stages(timings)
+            total_bytes += len(png)
+            rendered += 1
+
+            if out:
+                with open(os.path.join(out, encoding.filename(name)), 'wb') as f:
+                    f.write(png)
+
+        duration = time.perf_counter() - start
+
+    return {
+        'cards':        rendered,
+        'skipped':      skipped,
+        'failed':       failed,
+        'workers':      workers,
+        'encoding':     encoding.name,
+        'seconds':      duration,
+        'cards_per_s':  rendered / duration if duration else 0.0,
+        'mean_kb':      total_bytes / rendered / 1024 if rendered else 0.0,
+        'stages_ms':    {dict(labels)['stage']: {f'p{round(q * 100)}': hist.quantile(q) * 1000 for q in metrics.QUANTILES}
+                         for labels, hist in sorted(metrics.histograms('stage_seconds').items())},
+    }
+
+
+###### MAIN #################################################
+def main():
+    parser = argparse.ArgumentParser(description='Renders weather cards in bulk from a JSONL file of payloads or city names.')
+    parser.add_argument('input', help='JSONL file, - for stdin')
+    parser.add_argument('-o', '--out', help='directory to write the cards to')
+    parser.add_argument('-j', '--workers', type=int, default=WORKERS, help=f'worker processes (default {WORKERS})')
+    parser.add_argument('--cards', default=','.join(DEFAULT_CARDS), help=f'comma separated cards to render: {", ".join(CARDS)}')
+    parser.add_argument('--encoding', default=encoders.DEFAULT.name, choices=[e.name for e in encoders.Encoding])
+    parser.add_argument('--repeat', type=int, default=1, help='render everything this many times (load testing)')
+    parser.add_argument('--no-write', action='store_true', help="don't write the cards anywhere, just time them")
+    parser.add_argument('--stub', action='store_true', help='fetch city names from the benchmark stub server instead of weatherapi.com')
+    parser.add_argument('--report', help='also write the stats to this JSON file')
+    args = parser.parse_args()
+
+    cards = args.cards.split(',')
+    unknown = [card for card in cards if card not in CARDS]
+    if unknown:
+        parser.error(f'unknown cards: {", ".join(unknown)}')
+    if not args.out and not args.no_write:
+        parser.error('give an output directory with -o, or --no-write')
+
+    if args.input == '-':
+        jobs = read_jobs(sys.stdin)
+    else:
+        with open(args.input, encoding='utf-8') as f:
+            jobs = read_jobs(f)
+
+    days = max(CARDS[card][2] for card in cards)
+    if args.stub:
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+        from stub_server import StubServer
+
+        with StubServer() as stub:
+            providers.WEATHERAPI.url = stub.weatherapi_url
+            providers.WTTR.url = stub.wttr_url
+            jobs = fetch_missing(jobs, days)
+    else:
+        jobs = fetch_missing(jobs, days)
+
+    stats = render_all(jobs, cards, encoders.Encoding[args.encoding], args.workers, None if args.no_write else args.out, args.repeat)
+
+    print(f'Rendered {stats["cards"]} cards with {stats["workers"]} workers in {stats["seconds"]:.2f}s: '
+          f'{stats["cards_per_s"]:.1f} cards/s, {stats["mean_kb"]:.1f} KB each ({stats["encoding"]})')
+    if stats['skipped']:
+        print(f'Skipped {stats["skipped"]} cards needing more days of forecast than their payload has')
+    for city, failure in stats['failed'].items():
+        print(f'Failed {failure["cards"]} cards of {city}: {failure["error"]}')
+    for stage, quantiles in stats['stages_ms'].items():
+        print(f'  {stage:<8}' + '  '.join(f'{q} {ms:7.1f}ms' for q, ms in quantiles.items()))
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(stats, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+###### DESCRIPTION #################################################
+### Benchmarks of the hot path, from parsing the API data to rendering the cards and the full weather_report() / tomorrow()
+### requests (against the local stub server, so no network). Every benchmark records its latency percentiles, throughput
+### and peak memory, and the results are written to a JSON file named after the current commit so they can be compared later.
+###
+###     python benchmarks/bench.py                                  # run everything, write benchmarks/results/<commit>.json
+###     python benchmarks/bench.py -k render -n 50                  # only the benchmarks with "render" in their name, 50 runs each
+###     python benchmarks/bench.py --compare benchmarks/results/abc1234.json
+
+
+###### IMPORTS #################################################
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc                                                                                      # peak memory of each benchmark
+import numpy as np                                                                                      # preallocated buffers for the batch recolouring
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)                                                                                # the bot's modules live in the repo root
+os.chdir(ROOT)                                                                                          # and load their assets with relative paths
+
+from stub_server import StubServer, FIXTURES                                                            # local stand-in for the weather APIs
+import weather_report                                                                                   # the rest can only be imported after the sys.path tweak above
+import forecast_model
+import providers
+import recolour
+import icon_atlas
+import pill
+import layouts
+import weather_codes
+
+
+###### CONSTANTS #################################################
+ITERATIONS  = 30                                                                                        # timed runs of each benchmark (the quick ones run 100x more)
+WARMUP      = 3                                                                                         # untimed runs first, to load the assets
+MEMORY_RUNS = 3                                                                                         # runs under tracemalloc to get the peak memory (it slows everything down)
+RESULTS     = os.path.join(ROOT, 'benchmarks', 'results')
+CITIES      = ['cologne', 'los_angeles', 'reykjavik']                                                   # the recorded fixtures
+
+
+###### HELPERS #################################################
+def load_fixture(provider:str, city:str) -> dict:
+    with open(os.path.join(FIXTURES, f'{provider}_{city}.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+# Short hash of the current commit, to name the results file
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def percentile(sorted_values:list, p:float) -> float:
+    index = min(len(sorted_values) - 1, round(p / 100 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+###### BENCHMARKS #################################################
+def build_benchmarks() -> dict:
+    '''
+    Returns {name: (function to time, iterations multiplier)}. Every function does one unit of work per call.
+    '''
+    benchmarks = {}
+    datas = {city: load_fixture('weatherapi', city) for city in CITIES}
+    forecasts = {city: forecast_model.Forecast.from_weatherapi(city_data) for city, city_data in datas.items()}
+    data = datas['cologne']
+    forecast = forecasts['cologne']
+    hours = data['forecast']['forecastday'][0]['hour']
+
+    # Parsing helpers
+    benchmarks['parse.forecast_model']      = (lambda: forecast_model.Forecast.from_weatherapi(data), 10)
+    benchmarks['parse.get_hourly_forecast'] = (lambda: forecast_model.get_hourly_forecast(hours), 100)
+    benchmarks['parse.get_time']            = (lambda: (weather_report.get_time('14:37'), weather_report.get_time(' 1:55')), 100)
+    benchmarks['parse.get_daily_progress']  = (lambda: weather_report.get_daily_progress(weather_report.get_time('14:37')), 100)
+    as_of = weather_report.get_payload_time('cologne', forecast)                                        # the fixture's own clock, so the results don't change with the hour
+    benchmarks['parse.weather_report']      = (lambda: weather_report.parse_weather_report('cologne', forecast, as_of), 100)
+    benchmarks['parse.tomorrow']            = (lambda: weather_report.parse_tomorrow('cologne', forecast, False), 100)
+
+    # Recolouring
+    icon = icon_atlas.icon('PartlyCloudy', 128)
+    stack = recolour.stack([icon_atlas.icon(name, 64) for name in ['Cloudy', 'Fog', 'LightRain', 'Moon', 'PartlyCloudy', 'Sunny']])
+    palette = layouts.DARK_FRCST_COLOURS
+    out = np.empty_like(stack)                                                                          # preallocated buffers for the batch
+    scratch = np.empty((2,) + stack.shape[:3], dtype=np.float32)
+    benchmarks['recolour.recolour_128']     = (lambda: recolour.recolour(icon, layouts.ICON_COLOUR, (254, 192, 22)), 10)
+    benchmarks['recolour.tint_128']         = (lambda: recolour.tint(icon, (254, 192, 22), layouts.ICON_COLOUR), 10)
+    benchmarks['recolour.tint_batch_64x6']  = (lambda: recolour.tint_batch(stack, palette, layouts.ICON_COLOUR_64, out=out, scratch=scratch), 10)
+
+    # Rendering every fixture
+    for city, city_forecast in forecasts.items():
+        as_of = weather_report.get_payload_time(city, city_forecast)
+        hourly_args = weather_report.parse_weather_report(city, city_forecast, as_of)
+        if icon_atlas.exists(weather_codes.WWO_CODE[hourly_args[2]]):                                   # not every condition has its big icon yet (Reykjavik's heavy rain)
+            benchmarks[f'render.hourly.{city}']     = (lambda args=hourly_args: pill.create_weather_card_hourly(*args), 1)
+        benchmarks[f'render.tomorrow.{city}']       = (lambda args=weather_report.parse_tomorrow(city, city_forecast, False): pill.create_tomorrow_forecast(*args), 1)
+        benchmarks[f'render.tomorrow_dark.{city}']  = (lambda args=weather_report.parse_tomorrow(city, city_forecast, True): pill.create_tomorrow_forecast(*args), 1)
+        benchmarks[f'render.3_days.{city}']         = (lambda args=weather_report.parse_forecast_days(city, city_forecast, 3, False): pill.create_multiday_forecast(*args), 1)
+        simplified_args = weather_report.parse_simplified(city, city_forecast, as_of)
+        if icon_atlas.exists(weather_codes.WWO_CODE[simplified_args[-1]]):                              # not every condition has its big icon yet (Reykjavik's heavy rain)
+            benchmarks[f'render.simplified.{city}'] = (lambda args=simplified_args: pill.create_weather_card_simplified(*args), 1)
+
+    # Full requests through the stub server, cold (fetch + parse + render) and warm (cached forecast)
+    def cold(func, *args):
+        weather_report.FORECAST_CACHE.clear()
+        return func(*args)
+
+    benchmarks['pipeline.weather_report.cold']  = (lambda: cold(weather_report.weather_report, 'cologne'), 1)
+    benchmarks['pipeline.weather_report.warm']  = (lambda: weather_report.weather_report('cologne'), 1)
+    benchmarks['pipeline.tomorrow.cold']        = (lambda: cold(weather_report.tomorrow, 'cologne', False), 1)
+    benchmarks['pipeline.tomorrow.warm']        = (lambda: weather_report.tomorrow('cologne', False), 1)
+    benchmarks['pipeline.3_days.cold']          = (lambda: cold(weather_report.forecast_days, 'cologne', 3, False), 1)
+
+    return benchmarks
+
+def run_benchmark(func, iterations:int) -> dict:
+    '''
+    Times a function and returns its stats: latency in milliseconds, throughput in calls per second, and peak memory in KB.
+    '''
+    for _ in range(WARMUP):
+        func()
+
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        func()
+        times.append(time.perf_counter_ns() - start)
+
+    tracemalloc.start()
+    for _ in range(MEMORY_RUNS):
+        func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    times.sort()
+    total = sum(times)
+
+    return {
+        'iterations':   iterations,
+        'mean_ms':      total / iterations / 1e6,
+        'p50_ms':       percentile(times, 50) / 1e6,
+        'p99_ms':       percentile(times, 99) / 1e6,
+        'min_ms':       times[0] / 1e6,
+        'ops_per_s':    iterations / (total / 1e9),
+        'peak_kb':      peak / 1024,
+    }
+
+
+###### REPORTS #################################################
+def print_results(results:dict, baseline:dict=None) -> None:
+    header = f'{"benchmark":<36}{"p50 ms":>10}{"p99 ms":>10}{"ops/s":>12}{"peak KB":>10}'
+    print(header + ('   vs baseline (p50 / p99 / peak)' if baseline else ''))
+
+    for name, r in results.items():
+        line = f'{name:<36}{r["p50_ms"]:>10.3f}{r["p99_ms"]:>10.3f}{r["ops_per_s"]:>12.1f}{r["peak_kb"]:>10.1f}'
+
+        old = (baseline or {}).get(name)
+        if old:
+            change = lambda key: f'{(r[key] - old[key]) / old[key] * 100:+.0f}%' if old[key] else 'n/a'
+            line += f'   {change("p50_ms")} / {change("p99_ms")} / {change("peak_kb")}'
+
+        print(line)
+
+
+###### MAIN #################################################
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the weather card hot path.')
+    parser.add_argument('-n', '--iterations', type=int, default=ITERATIONS, help='timed runs of each benchmark')
+    parser.add_argument('-k', '--filter', default='', help='only run benchmarks whose name contains this')
+    parser.add_argument('-o', '--out', help='results file (default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', help='results file of an earlier run to compare against')
+    args = parser.parse_args()
+
+    with StubServer() as stub:
+        providers.WEATHERAPI.url = stub.weatherapi_url                                                  # pointing the fetchers at the stub
+        providers.WTTR.url = stub.wttr_url
+
+        results = {}
+        for name, (func, multiplier) in build_benchmarks().items():
+            if args.filter in name:
+                results[name] = run_benchmark(func, args.iterations * multiplier)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+
+    print_results(results, baseline)
+
+    commit = git_commit()
+    out = args.out or os.path.join(RESULTS, f'{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump({
+            'commit':   commit,
+            'time':     time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python':   platform.python_version(),
+            'machine':  f'{platform.system()} {platform.machine()} ({os.cpu_count()} cores)',
+            'results':  results,
+        }, f, indent=2)
+
+    print(f'\nResults written to {out}')
+
+
+if __name__ == '__main__':
+    main()
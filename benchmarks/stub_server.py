@@ -0,0 +1,115 @@
+###### DESCRIPTION #################################################
+### A local stand-in for weatherapi.com and wttr.in that serves the recorded JSON fixtures, so the full
+### weather_report() / tomorrow() paths can be benchmarked without the network or the API quota.
+###
+###     /v1/forecast.json?q=<city>      -> fixtures/weatherapi_<city>.json
+###     /<city>?format=j1               -> fixtures/wttr_<city>.json
+###
+### Cities are matched by their fixture name ("Los Angeles" -> los_angeles), unknown cities get the first fixture.
+### Run this script to keep a stub server running on a port of your choice.
+
+
+###### IMPORTS #################################################
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer                                     # good enough for a local stub
+import os
+import threading
+from urllib.parse import urlsplit, parse_qs, unquote
+
+
+###### CONSTANTS #################################################
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+###### HELPERS #################################################
+# Loads every fixture of a provider into memory -> {city: JSON bytes}
+def load_fixtures(provider:str) -> dict:
+    fixtures = {}
+    for filename in sorted(os.listdir(FIXTURES)):
+        if filename.startswith(provider + '_') and filename.endswith('.json'):
+            city = filename[len(provider) + 1:-5]
+            with open(os.path.join(FIXTURES, filename), 'rb') as f:
+                fixtures[city] = f.read()
+
+    return fixtures
+
+# "Los Angeles" or "Los Angeles, United States of America" -> "los_angeles"
+def fixture_name(city:str) -> str:
+    return '_'.join(city.split(',')[0].casefold().split())
+
+
+###### SERVER #################################################
+class StubHandler(BaseHTTPRequestHandler):
+    weatherapi  = load_fixtures('weatherapi')
+    wttr        = load_fixtures('wttr')
+    delay       = 0.0                                                                                   # seconds of fake network latency added to every response
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+
+        if url.path == '/v1/forecast.json':
+            fixtures = self.weatherapi
+            city = parse_qs(url.query).get('q', [''])[0]
+        else:
+            fixtures = self.wttr
+            city = unquote(url.path.lstrip('/'))
+
+        body = fixtures.get(fixture_name(city)) or next(iter(fixtures.values()))
+
+        if self.delay:
+            threading.Event().wait(self.delay)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):                                                               # keeping the benchmark output clean
+        pass
+
+
+class StubServer:
+    '''
+    Runs the stub server on a background thread.
+
+    port: port to listen on, 0 picks a free one
+    delay: seconds of fake network latency added to every response
+    '''
+    def __init__(self, port:int=0, delay:float=0.0) -> None:
+        handler = type('Handler', (StubHandler,), {'delay': delay})
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address
+        return f'http://{host}:{port}'
+
+    # Drop-in replacements for providers.WEATHERAPI.url and providers.WTTR.url
+    @property
+    def weatherapi_url(self) -> str:
+        return self.url + '/v1/forecast.json?key=stub&q={}&days={}'
+
+    @property
+    def wttr_url(self) -> str:
+        return self.url + '/{}?format=j1'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == '__main__':
+    import sys
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+    with StubServer(port) as stub:
+        print(f'Serving fixtures on {stub.url} (ctrl+c to stop)')
+        try:
+            stub.thread.join()
+        except KeyboardInterrupt:
+            pass
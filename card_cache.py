@@ -0,0 +1,74 @@
+###### DESCRIPTION #################################################
+### Cache of finished weather cards. The pill functions always draw the same image for the same inputs, so the cards
+### are stored under a hash of the function and its arguments, and a repeat request gets the PNG bytes back without touching PIL.
+### The cache is bounded by the total size of the stored images, evicting the least recently used card first.
+
+
+###### IMPORTS #################################################
+from collections import OrderedDict                                                                     # keeps entries in least -> most recently used order
+import hashlib                                                                                          # hashing the render inputs
+
+
+###### CONSTANTS #################################################
+CARD_CACHE_BYTES = 64 * 1024 * 1024                                                                     # 64MB worth of images, roughly a thousand cards
+
+
+###### HELPERS #################################################
+# Hashes a pill function and its arguments into a cache key
+def card_key(func, args:tuple) -> str:
+    inputs = repr((func.__module__, func.__name__, args))                                               # the arguments are all strings, numbers, bools and lists of those
+    return hashlib.sha256(inputs.encode()).hexdigest()
+
+
+###### CACHE #################################################
+class CardCache:
+    '''
+    An LRU cache of encoded cards with a budget in bytes.
+
+    max_bytes: total size of the images kept, the least recently used one is evicted first
+    '''
+    def __init__(self, max_bytes:int=CARD_CACHE_BYTES) -> None:
+        self.max_bytes  = max_bytes
+        self.size       = 0                                                                             # bytes currently stored
+        self.hits       = 0
+        self.misses     = 0
+        self._cards     = OrderedDict()                                                                 # key -> image bytes
+
+    def __len__(self) -> int:
+        return len(self._cards)
+
+    def get(self, key:str) -> bytes:
+        '''
+        Returns the stored image bytes for a key, or None.
+        '''
+        png = self._cards.get(key)
+
+        if png is None:
+            self.misses += 1
+            return None
+
+        self._cards.move_to_end(key)                                                                    # marking it as the most recently used
+        self.hits += 1
+        return png
+
+    def put(self, key:str, png:bytes) -> None:
+        '''
+        Stores the image bytes of a card, evicting the least recently used cards until it fits in the budget.
+        '''
+        if len(png) > self.max_bytes:                                                                   # would evict everything and still not fit
+            return
+
+        old = self._cards.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+
+        self._cards[key] = png
+        self.size += len(png)
+
+        while self.size > self.max_bytes:
+            _, evicted = self._cards.popitem(last=False)
+            self.size -= len(evicted)
+
+    def clear(self) -> None:
+        self._cards.clear()
+        self.size = 0
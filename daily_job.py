@@ -0,0 +1,92 @@
+###### DESCRIPTION #################################################
+### The fan-out behind David Lynch's daily forecasts. Subscribers are grouped by city so every city is fetched and
+### rendered only once, a few cities are worked on at the same time, and each card is handed to the sender as soon as it's ready.
+### A city that fails is recorded in the run report instead of stopping everyone else's forecast.
+
+
+###### IMPORTS #################################################
+import asyncio                                                                                          # running several cities at once
+import time                                                                                             # timing the run
+
+
+###### CONSTANTS #################################################
+DAILY_CONCURRENCY = 8                                                                                   # max number of cities being fetched and rendered at the same time
+
+
+###### REPORT #################################################
+class DailyRun:
+    '''
+    Timings and failures of one run of the daily forecast job.
+    '''
+    def __init__(self) -> None:
+        self.started        = time.perf_counter()
+        self.duration       = 0.0                                                                       # seconds the whole run took
+        self.cities         = 0                                                                         # distinct cities in the run
+        self.subscribers    = 0                                                                         # total subscribers in the run
+        self.sent           = 0                                                                         # subscribers who got their card
+        self.render_times   = {}                                                                        # city -> seconds spent fetching and rendering it
+        self.failures       = {}                                                                        # city -> exception that stopped it
+
+    def summary(self) -> str:
+        slowest = max(self.render_times.items(), key=lambda x: x[1], default=None)
+        msg = f'Daily forecast: sent {self.sent}/{self.subscribers} subscribers in {self.cities} cities, took {self.duration:.1f}s'
+
+        if slowest is not None:
+            msg += f', slowest city {slowest[0]} ({slowest[1]:.2f}s)'
+        if self.failures:
+            msg += '\nFailed: ' + ', '.join(f'{city} ({error!r})' for city, error in self.failures.items())
+
+        return msg
+
+
+###### JOB #################################################
+async def run(groups, render, send, concurrency:int=DAILY_CONCURRENCY) -> DailyRun:
+    '''
+    Renders one card per distinct city and sends it to all of that city's subscribers.
+
+    groups: iterable of (city, [userIDs]), one per distinct city, read lazily (like SubscriptionStore.iter_by_city())
+    render: async function taking a city and returning its weather card as BytesIO
+    send: async function taking the city, the list of userIDs and the weather card
+    concurrency: max number of cities being rendered at the same time
+    '''
+    report = DailyRun()
+    groups = iter(groups)
+    ready = asyncio.Queue()                                                                             # (city, userIDs, weather card, error) of the rendered cities, None once they're all done
+
+    # Fetching and rendering the next city until there are none left, catching the error so one bad city doesn't abort the batch
+    async def render_cities():
+        for city, user_ids in groups:                                                                   # shared by every worker, each takes the next city (next() never awaits, so that's safe)
+            report.cities += 1
+            report.subscribers += len(user_ids)
+
+            start = time.perf_counter()
+            try:
+                weather_card = await render(city)
+                error = None
+            except Exception as e:
+                weather_card = None
+                error = e
+            report.render_times[city] = time.perf_counter() - start
+
+            await ready.put((city, user_ids, weather_card, error))
+
+    workers = asyncio.gather(*[render_cities() for _ in range(concurrency)])
+    workers.add_done_callback(lambda _: ready.put_nowait(None))
+
+    # Sending every card as soon as it's ready instead of waiting for all of them
+    while (rendered := await ready.get()) is not None:
+        city, user_ids, weather_card, error = rendered
+
+        if error is None:
+            try:
+                await send(city, user_ids, weather_card)
+                report.sent += len(user_ids)
+            except Exception as e:
+                error = e
+
+        if error is not None:
+            report.failures[city] = error
+
+    await workers                                                                                       # raises if reading the groups failed
+    report.duration = time.perf_counter() - report.started
+    return report
@@ -0,0 +1,182 @@
+###### DESCRIPTION #################################################
+### When the daily forecasts go out. Every subscribed city gets its card at 7AM in its own time zone instead of everyone
+### getting theirs at the same moment, so the work is spread over the day. The cities are kept in a heap ordered by their next
+### slot, and a few minutes before a slot every city due then is fetched and rendered (through daily_job), so the cards are
+### ready and go out right on time. A city's time zone comes from the weatherapi.com location block the first time it's seen.
+
+
+###### IMPORTS #################################################
+import asyncio
+from datetime import datetime, time, timedelta, timezone
+import heapq                                                                                            # cities ordered by their next slot
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError                                                   # local 7AM, including daylight saving time
+import daily_job                                                                                        # fetching, rendering and sending a batch of cities
+import scheduler                                                                                        # the API queues and 429s, printed after every run
+
+
+###### CONSTANTS #################################################
+SEND_HOUR       = 7                                                                                     # local hour the daily forecast is sent at
+PREPARE_LEAD    = timedelta(minutes=5)                                                                  # how long before the slot a city is fetched and rendered
+RESCAN          = 15 * 60                                                                               # max seconds between checks for new subscribed cities
+
+
+###### HELPERS #################################################
+# The time zone with this IANA name, or UTC if it's missing or unknown (Windows needs the tzdata package for zoneinfo)
+def get_zone(tz_id:str):
+    try:
+        return ZoneInfo(tz_id) if tz_id else timezone.utc
+    except (ZoneInfoNotFoundError, ValueError):
+        print(f'Unknown time zone {tz_id!r}, using UTC')
+        return timezone.utc
+
+def next_slot(tz_id:str, after:datetime, hour:int=SEND_HOUR) -> datetime:
+    '''
+    Returns the first `hour` o'clock in a time zone strictly after a moment, as a UTC datetime.
+
+    tz_id: IANA time zone of the city, UTC if None
+    after: timezone aware datetime
+    '''
+    zone = get_zone(tz_id)
+    local = after.astimezone(zone)
+    slot = datetime.combine(local.date(), time(hour), tzinfo=zone)
+
+    if slot <= local:
+        slot = datetime.combine(local.date() + timedelta(days=1), time(hour), tzinfo=zone)
+
+    return slot.astimezone(timezone.utc)
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+# Sleeps until a UTC datetime (returns right away if it's already passed)
+async def sleep_until(when:datetime) -> None:
+    await asyncio.sleep(max(0.0, (when - utcnow()).total_seconds()))
+
+
+###### SCHEDULER #################################################
+class DailySchedule:
+    '''
+    Sends every subscribed city its daily forecast at SEND_HOUR local time.
+
+    store: subscriptions.SubscriptionStore of the subscribers
+    render: async function taking a city and the datetime of its slot and returning its weather card as BytesIO
+    send: async function taking the city, the list of userIDs and the weather card (see daily_job.run())
+    locate: async function taking a city and returning its IANA time zone
+    prepare_lead: how long before the slot the cards are rendered
+    '''
+    def __init__(self, store, render, send, locate, prepare_lead:timedelta=PREPARE_LEAD) -> None:
+        self.store          = store
+        self.render         = render
+        self.send           = send
+        self.locate         = locate
+        self.prepare_lead   = prepare_lead
+        self.last_report    = None                                                                      # daily_job.DailyRun of the last slot
+        self._heap          = []                                                                        # (slot, city_key)
+        self._scheduled     = set()                                                                     # city keys in the heap
+        self._wakeup        = None                                                                      # set to re-check the subscribers right away
+        self._task          = None
+        self._deliveries    = set()                                                                     # deliver() tasks in flight, so they aren't garbage collected
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def upcoming(self) -> list:
+        '''
+        Returns (slot, city_key) of every scheduled city, soonest first.
+        '''
+        return sorted(self._heap)
+
+    def start(self) -> None:
+        '''
+        Starts the schedule on the running event loop, unless it's already running.
+        '''
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self.run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        self._task = None
+
+    def wake(self) -> None:
+        '''
+        Picks up new subscriptions right away instead of at the next rescan.
+        '''
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def refresh(self) -> None:
+        '''
+        Looks up the time zone of new cities and puts every subscribed city that isn't scheduled yet in the heap.
+        '''
+        earliest = utcnow() + self.prepare_lead                                                         # too late to prepare anything before this
+
+        for city_key, city, tz_id in self.store.cities():
+            if city_key in self._scheduled:
+                continue
+
+            if tz_id is None:
+                try:
+                    tz_id = await self.locate(city)
+                    self.store.set_timezone(city_key, tz_id)
+                except Exception as e:                                                                  # tried again at the next refresh
+                    print(f'Could not find the time zone of {city}: {e!r}')
+                    continue
+
+            heapq.heappush(self._heap, (next_slot(tz_id, earliest), city_key))
+            self._scheduled.add(city_key)
+
+    async def run(self) -> None:
+        '''
+        The scheduling loop, see start().
+        '''
+        while True:
+            self._wakeup.clear()                                                                        # anything subscribed from here on is picked up by this refresh or the next
+            await self.refresh()
+
+            wait = RESCAN
+            if self._heap:
+                wait = min(wait, (self._heap[0][0] - self.prepare_lead - utcnow()).total_seconds())
+
+            if wait > 0:                                                                                # sleeping until the next slot, a new subscription or the rescan
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            slot, city_key = heapq.heappop(self._heap)
+            due = [city_key]
+            while self._heap and self._heap[0][0] == slot:                                              # every city in the same time zone (or offset) shares the slot
+                due.append(heapq.heappop(self._heap)[1])
+
+            self._scheduled.difference_update(due)                                                      # rescheduled for the next day by the refresh
+            delivery = asyncio.ensure_future(self.deliver(slot, due))
+            self._deliveries.add(delivery)
+            delivery.add_done_callback(self.delivered)
+
+    # Forgets a finished deliver() task, printing why it failed if it did (daily_job.run() reports its own failures)
+    def delivered(self, delivery:asyncio.Task) -> None:
+        self._deliveries.discard(delivery)
+        if not delivery.cancelled() and delivery.exception() is not None:
+            print(f'Daily delivery failed: {delivery.exception()!r}')
+
+    async def deliver(self, slot:datetime, city_keys:list) -> daily_job.DailyRun:
+        '''
+        Renders the cards of the cities due at a slot right away, and sends them once the slot comes.
+        '''
+        groups = self.store.iter_by_city(city_keys)                                                     # read as the workers take the cities, skipping the ones everyone unsubscribed from
+
+        async def render(city):
+            return await self.render(city, slot)
+
+        async def send(city, user_ids, weather_card):
+            await sleep_until(slot)
+            await self.send(city, user_ids, weather_card)
+
+        report = self.last_report = await daily_job.run(groups, render, send)
+        print(f'[{slot:%H:%M} UTC] {report.summary()}')
+        print(scheduler.summary())                                                                      # how long the run waited on the weather APIs
+
+        return report
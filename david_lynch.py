@@ -9,32 +9,42 @@ from discord_slash import SlashCommand, SlashContext
 from discord_slash.utils.manage_commands import create_option, create_choice                                            # used to specify the type of argument required
 
 from datetime import datetime                                                                                           # for David Lynch's classic weather report intro
+from io import BytesIO                                                                                                  # copies of the weather cards in memory
 import requests                                                                                                         # python's curl command
 
 import weather_report                                                                                                   # my script that handles API requests, formatting the data, and calling pill.py to create the images
-
-import pandas as pd
+import render_pool                                                                                                      # worker processes that render the cards without blocking the bot
+from daily_schedule import DailySchedule                                                                                # sends the daily forecasts at 7AM in each city's own time zone
+import encoders                                                                                                         # which image format the cards are uploaded as
+import gazetteer                                                                                                        # offline city index for the autocomplete and the subscriptions
+import scheduler                                                                                                        # the daily job's API requests wait behind the slash commands
+import resources                                                                                                        # warming the city index at startup
+import metrics                                                                                                          # latency of every stage of the commands, dumped to the log or served to Prometheus
+from subscriptions import SubscriptionStore                                                                             # SQLite database of the daily forecast subscribers
 
 ###### CONSTANTS #################################################
 TEXTCHANNEL = 349267380452589568
 TOKEN_FILE = '.david_lynch.token'                                                                                       # Name of the text file storing the unique Discord bot token (very dangerous, do not share)
-DAILY_FILE = 'daily_forecasts.csv'
+DAILY_FILE = 'daily_forecasts.db'                                                                                       # SQLite database of subscribers (imports the old daily_forecasts.csv when first created)
+FORECAST_FILE = 'forecasts.db'                                                                                          # SQLite database of the last good forecast of every city, served when restarting or when weatherapi.com is down
+COMPACT_MINUTES = 30                                                                                                    # how often the old forecasts are deleted from FORECAST_FILE
+MAX_MENTIONS = 50                                                                                                       # max subscribers pinged in one message, to stay under Discord's 2000 character limit
+
+# Image encoding of each command's cards (encoders.Encoding), None uses encoders.DEFAULT
+WEATHER_ENCODING    = None
+FORECAST_ENCODING   = None
+DAILY_ENCODING      = encoders.Encoding.PNG_PALETTE                                                                     # lots of uploads in one go, so the smallest files
+
+METRICS_PORT = None                                                                                                     # port to serve the Prometheus metrics on (http://127.0.0.1:PORT/metrics), None to only dump them to the log
+METRICS_DUMP_MINUTES = 15                                                                                               # how often the metrics summary is printed
 
 # Gets the Discord bot token
 def get_token(token_file):
     with open(token_file, 'r') as f:
         return f.read()
 
-# Gets the CSV file containing the daily forecast database and returns it as a pandas dataframe
-def get_daily_forecast_df() -> pd.DataFrame:
-    try:
-        df = pd.read_csv(DAILY_FILE, header=0, index_col=0)
-
-    except:
-        df = pd.DataFrame(columns=['userID', 'city'])
-        df.set_index('userID', inplace=True)
-    
-    return df
+SUBSCRIBERS = SubscriptionStore(DAILY_FILE)                                                                             # Users and their requested cities for the daily forecast
+weather_report.open_disk_cache(FORECAST_FILE)                                                                           # the forecasts survive restarts from now on
 
 
 #The command prefix of all the commands
@@ -45,6 +55,23 @@ guild_ids = [349267379991347200]
 print("_____________DAVID LYNCH INITIALISED_____________")
 
 
+# The "city" option of every command, with autocomplete (discord_slash doesn't know about autocomplete, so the flag is set on the raw option)
+def city_option():
+    option = create_option(
+        name="city",
+        description="🏙️ Which city to report on? 🌇",
+        option_type=3,                                                                                                  # 3 = STRING
+        required=True
+    )
+    option['autocomplete'] = True
+    return option
+
+# Tells the user when their city was a typo that got corrected to a known one, so they know whose weather they're getting
+def correction_note(city:str) -> str:
+    corrected = gazetteer.corrected(city)
+    return f'Couldn\'t find **{city.strip()}**, so here\'s **{corrected}** instead 🤔' if corrected else ''
+
+
 ###### DISCORD STUFF //// #################################################  
 # Runs this when the bot becomes online
 @bot.event
@@ -54,8 +81,36 @@ async def on_ready():
     print(f'Good morning. It\'s {today}, and it\'s a {weekday}!')                                                       # just a print in the console to confirm the bot is running
     
     await bot.change_presence(activity=discord.Game('Golden sunshine all along the way! 🌞'))                           # custom status
+    await render_pool.start()                                                                                           # spawns the render workers before the first command comes in
+    resources.warm(['gazetteer'], background=True)                                                                      # loads the city index before the first autocomplete
     daily_msg.start()                                                                                                   # starts the daily greeting loop
-    daily_forecast_task.start()                                                                                         # starts the daily forecast loop
+    DAILY_SCHEDULE.start()                                                                                              # starts the daily forecast schedule (does nothing if it's already running)
+    if not warm_cache.is_running():
+        warm_cache.start()                                                                                              # starts keeping the most requested cities warm
+    if not compact_forecasts.is_running():
+        compact_forecasts.start()                                                                                       # starts deleting the forecasts too old to serve from disk
+    if not dump_metrics.is_running():
+        dump_metrics.start()                                                                                            # starts printing the metrics every now and then
+        if METRICS_PORT is not None:
+            await metrics.serve(METRICS_PORT)
+
+
+
+# Answers the autocomplete requests of the "city" options (interaction type 4) with matching cities from the gazetteer
+@bot.listen('on_socket_response')
+async def city_autocomplete(msg):
+    if msg.get('t') != 'INTERACTION_CREATE' or msg['d'].get('type') != 4:                                              # everything else is discord_slash's business
+        return
+
+    interaction = msg['d']
+    focused = next((o for o in interaction['data'].get('options', []) if o.get('focused')), None)
+    if focused is None or focused['name'] != 'city':
+        return
+
+    choices = [{'name': city, 'value': city} for city in gazetteer.autocomplete(focused['value'])]
+    route = discord.http.Route('POST', '/interactions/{interaction_id}/{interaction_token}/callback',
+                               interaction_id=interaction['id'], interaction_token=interaction['token'])
+    await bot.http.request(route, json={'type': 8, 'data': {'choices': choices}})                                       # 8 = APPLICATION_COMMAND_AUTOCOMPLETE_RESULT
 
 
 
@@ -75,17 +130,45 @@ async def daily_msg():
     channel = bot.get_channel(TEXTCHANNEL)                                                                              # Gets the #textchatgenerals channel directly
     await channel.send(msg)                                                                                             # sends the message to the channel                                                                             
 
-@tasks.loop(hours=24, seconds=10)
-async def daily_forecast_task():
-    print("Time for the daily forecast!")
+# Prints the latency percentiles, cache hit ratios and queue depths
+@tasks.loop(minutes=METRICS_DUMP_MINUTES)
+async def dump_metrics():
+    print(metrics.summary())
+
+# Deletes the forecasts too old to serve from the disk cache, and the least recently fetched ones if there are too many
+@tasks.loop(minutes=COMPACT_MINUTES)
+async def compact_forecasts():
+    deleted = await weather_report.compact_disk_cache()
+    if deleted:
+        print(f'Deleted {deleted} old forecasts from {FORECAST_FILE}')
+
+# Refreshes the most requested cities just before their forecasts expire, and renders their cards again
+@tasks.loop(seconds=30)
+async def warm_cache():
+    await weather_report.warm_popular()
+
+### The daily forecast, sent at 7AM in each subscribed city's own time zone
+# Renders a city's weather report card a few minutes ahead of its slot, showing the time it will be sent at
+async def render_daily_card(city, slot):
+    return await weather_report.weather_report_async(city, DAILY_ENCODING, scheduler.BATCH, as_of=slot)
+
+# Sends a city's weather report card to all of its subscribers
+async def send_daily_card(city, user_ids, weather_card):
+    print(f"Time for the daily forecast in {city}!")
     channel = bot.get_channel(TEXTCHANNEL)                                                                              # Gets the #textchatgenerals channel directly
-    df = get_daily_forecast_df()                                                                                        # Gets the dataframe with users and their requested cities
+    filename = encoders.resolve(DAILY_ENCODING).filename()
+
+    for i in range(0, len(user_ids), MAX_MENTIONS):
+        mentions = ' '.join(f'<@{user_id}>' for user_id in user_ids[i:i + MAX_MENTIONS])
+        card = BytesIO(weather_card.getvalue())                                                                         # a fresh file object for every message
+        with metrics.stage('upload'):
+            await channel.send(f"{mentions} Here's the weather for **{city}** today, champ! 🕶️", file=discord.File(card, filename))
 
-    # loop over all items in the dataframe and create a weather report card for each user and their city
-    for index, row in df.iterrows():
-        weather_card = weather_report.weather_report(row.city)
-        weather_card.seek(0)
-        await channel.send(f"<@{index}> Here's the weather for **{row.city}** today, champ! 🕶️", file=discord.File(weather_card, 'weather_report.png'))
+# The time zone of a city, the first time someone subscribes to it
+async def locate_city(city):
+    return await weather_report.get_timezone_async(city, scheduler.BATCH)
+
+DAILY_SCHEDULE = DailySchedule(SUBSCRIBERS, render_daily_card, send_daily_card, locate_city)
 
 
 ###### SLASH COMMANDS //// #################################################                                            -> https://discord-py-slash-command.readthedocs.io/en/latest/gettingstarted.html
@@ -95,12 +178,7 @@ async def daily_forecast_task():
              description="The current weather report 😎🌞",
              guild_ids=guild_ids,
              options=[
-                 create_option(
-                    name="city",
-                    description="🏙️ Which city to report on? 🌇",
-                    option_type=3,                                                                                          # 3 = STRING
-                    required=True
-                ),
+                 city_option(),
                  create_option(
                     name='simplified',
                     description='Full report with hourly forecasts, or classic simplified version?',
@@ -113,14 +191,21 @@ async def weather(ctx, city, simplified=False):
 
     # Simplified report
     if simplified:
-        weather_report.weather_simplified(city)
-        await ctx.send(file=discord.File('weather_report.png'))
+        with metrics.track('command', command='weather_simplified'):
+            encoding = encoders.resolve(WEATHER_ENCODING)
+            weather_card = await weather_report.weather_simplified_async(city, encoding)
+            weather_card.seek(0)
+            with metrics.stage('upload'):
+                await ctx.send(correction_note(city), file=discord.File(weather_card, encoding.filename()))
     
     # Full Report
     else:
-        weather_card = weather_report.weather_report(city)
-        weather_card.seek(0)                                                                                            # "Pillow sets the file pointer at the end when it saves. You'll have to seek back to the start of the buffer"
-        await ctx.send(file=discord.File(weather_card, 'weather_report.png'))                                           # Sending an image as a bytes object from memory as "weather_report.png"
+        with metrics.track('command', command='weather'):
+            encoding = encoders.resolve(WEATHER_ENCODING)
+            weather_card = await weather_report.weather_report_async(city, encoding)
+            weather_card.seek(0)                                                                                        # "Pillow sets the file pointer at the end when it saves. You'll have to seek back to the start of the buffer"
+            with metrics.stage('upload'):
+                await ctx.send(correction_note(city), file=discord.File(weather_card, encoding.filename()))             # Sending an image as a bytes object from memory as "weather_report.png"
 
 
 
@@ -129,12 +214,7 @@ async def weather(ctx, city, simplified=False):
             guild_ids=guild_ids,                                                                                        # For some reason, this is needed here
             description='The weather forecast report 😎🌞⛅🌧️📅',                                                     # The command's description in the discord UI
             options=[                                                                                                   # Variables shown as choices - cool! but looks like a hot mess
-                create_option(
-                 name="city",
-                 description="🏙️ Which city to report on? 🌇",
-                 option_type=3,                                                                                         # 3 = STRING
-                 required=True
-               ),
+                city_option(),
                create_option(
                    name="transparent",
                    description="Transparent PNG background instead of light solid background",
@@ -165,9 +245,17 @@ async def weather(ctx, city, simplified=False):
 
 # The weather forecast
 async def forecast(ctx, city, transparent = False, period = "1"):
-    weather_card = weather_report.tomorrow(city, transparent)
-    weather_card.seek(0)                                                                                            # "Pillow sets the file pointer at the end when it saves. You'll have to seek back to the start of the buffer"
-    await ctx.send(file=discord.File(weather_card, 'weather_report.png'))                                           # Sending an image as a bytes object from memory as "weather_report.png"
+    with metrics.track('command', command='forecast'):
+        encoding = encoders.resolve(FORECAST_ENCODING)
+
+        if period == "1":                                                                                           # just tomorrow
+            weather_card = await weather_report.tomorrow_async(city, transparent, encoding)
+        else:                                                                                                       # a panel for each day, starting today
+            weather_card = await weather_report.forecast_days_async(city, int(period), transparent, encoding)
+
+        weather_card.seek(0)                                                                                        # "Pillow sets the file pointer at the end when it saves. You'll have to seek back to the start of the buffer"
+        with metrics.stage('upload'):
+            await ctx.send(correction_note(city), file=discord.File(weather_card, encoding.filename()))            # Sending an image as a bytes object from memory as "weather_report.png"
 
 
 # Choosing a 
@@ -176,12 +264,7 @@ async def forecast(ctx, city, transparent = False, period = "1"):
         guild_ids=guild_ids,
         description="🌞 Get a daily morning weather report for your chosen city! ⏰",
         options=[
-            create_option(
-                name="city",
-                description="🏙️ Which city to report on? 🌇",
-                option_type=3,                                                                                          # 3 = STRING
-                required=True
-            ),
+            city_option(),
             create_option(
                 name="cancel",
                 description="❌Cancel your daily forecast ✋",
@@ -191,27 +274,25 @@ async def forecast(ctx, city, transparent = False, period = "1"):
         ]
 )
 async def daily_forecast(ctx, city:str, cancel:bool = False):
-    df = get_daily_forecast_df()
     userID = ctx.author.id
 
     # Cancelling a user's daily forecast
     if cancel:
-        # checking that the user is actually in the dataframe
-        if userID not in df.index:
+        # deleting their record, if they actually have one
+        if not SUBSCRIBERS.unsubscribe(userID):
             await ctx.send("Can't cancel your daily forecast if you don't have one to begin with, champ! 👍")
             return
         
-        # if so, delete their record
-        df.drop(userID, inplace=True)
         await ctx.send("No more daily reports for you, pal! ✌️")
-        df.to_csv(DAILY_FILE)
         return
 
     # Add/Update their record with the given city
-    df.loc[userID] = city.capitalize()
-    df.to_csv(DAILY_FILE)
+    note = correction_note(city)
+    city = gazetteer.canonical(city)                                                                                    # "köln" and "Cologne" are the same subscription
+    SUBSCRIBERS.subscribe(userID, city)
+    DAILY_SCHEDULE.wake()                                                                                               # schedules the city right away if it's a new one
 
-    await ctx.send(f'Okay, I\'ll get you a weather report for **{city}** every morning! 👍')
+    await ctx.send(f'{note}\nOkay, I\'ll get you a weather report for **{city}** every morning! 👍'.strip())
 
 
 
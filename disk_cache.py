@@ -0,0 +1,113 @@
+###### DESCRIPTION #################################################
+### The last good forecast of every city, on disk, so a restart doesn't start cold and a weatherapi.com outage doesn't make
+### every command fail. Each downloaded forecast is stored in SQLite as zlib compressed JSON of its forecast_model.Forecast
+### (under 1KB a city) along with the wall clock time it was fetched, so its age survives restarts.
+### weather_report reads it stale-while-revalidate: a stored forecast is served right away, and refreshed in the background
+### if it's older than the in-memory TTL. compact() deletes the forecasts too old to serve and keeps the file to a max size.
+### put() and compact() write through a connection of their own, so the bot can run them on another thread (WAL lets get()
+### keep reading meanwhile) instead of waiting for the commits on the event loop.
+
+
+###### IMPORTS #################################################
+import sqlite3                                                                                          # the database itself
+import time                                                                                             # wall clock, so the age of a forecast survives restarts
+import zlib                                                                                             # compressing the stored forecasts
+from forecast_cache import normalize_city                                                               # the same keys as the in-memory cache
+from forecast_model import Forecast                                                                     # what's stored
+
+
+###### CONSTANTS #################################################
+FORECAST_DB     = 'forecasts.db'                                                                        # the SQLite database file
+MAX_STALE       = 6 * 60 * 60                                                                           # seconds a forecast is still served while it's refreshed, older ones are deleted
+MAX_CITIES      = 4096                                                                                  # max cities kept on disk, the least recently fetched are deleted first
+COMPRESSION     = 6                                                                                     # zlib level
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS forecasts (
+    city_key    TEXT PRIMARY KEY,
+    days        INTEGER NOT NULL,
+    fetched     REAL NOT NULL,
+    forecast    BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS forecasts_fetched ON forecasts (fetched);
+'''
+
+
+###### CACHE #################################################
+class DiskCache:
+    '''
+    Compressed forecasts in SQLite, keyed by the gazetteer's location key.
+    get() reads on the thread that created it, put() and compact() can write from any one other thread.
+
+    path: SQLite database file
+    max_stale: seconds after which a forecast isn't served anymore
+    max_cities: max amount of cities kept, the least recently fetched are deleted first by compact()
+    '''
+    def __init__(self, path:str=FORECAST_DB, max_stale:float=MAX_STALE, max_cities:int=MAX_CITIES) -> None:
+        self.max_stale  = max_stale
+        self.max_cities = max_cities
+        self.hits       = 0
+        self.misses     = 0
+        self.deleted    = 0                                                                             # forecasts deleted by compact()
+
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')                                                      # readers don't block the writer and vice versa
+        self.db.execute('PRAGMA synchronous=NORMAL')                                                    # losing the last few forecasts in a power cut is fine
+        self.db.executescript(SCHEMA)
+
+        self.writer = sqlite3.connect(path, check_same_thread=False)                                    # put() and compact(), see weather_report.DISK_WRITER
+        self.writer.execute('PRAGMA synchronous=NORMAL')
+
+    def __len__(self) -> int:
+        return self.db.execute('SELECT COUNT(*) FROM forecasts').fetchone()[0]
+
+    def get(self, city:str, days:int=1) -> tuple:
+        '''
+        Returns (age in seconds, days, Forecast) of a city stored with at least that many days of forecast,
+        or None if it's missing, too old or unreadable.
+        '''
+        row = self.db.execute('SELECT days, fetched, forecast FROM forecasts WHERE city_key = ?', (normalize_city(city),)).fetchone()
+        age = time.time() - row[1] if row else None
+
+        if row is None or row[0] < days or age > self.max_stale:
+            self.misses += 1
+            return None
+
+        try:
+            forecast = Forecast.from_json(zlib.decompress(row[2]).decode('utf-8'))
+        except (zlib.error, ValueError, TypeError):                                                     # written by a version with a different model, it'll be overwritten
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return age, row[0], forecast
+
+    def put(self, city:str, days:int, forecast:Forecast, fetched:float=None) -> None:
+        '''
+        Stores the forecast of a city, replacing the one it had.
+
+        days: days of forecast it was fetched with
+        fetched: wall clock time it was fetched at, now if None
+        '''
+        blob = zlib.compress(forecast.to_json().encode('utf-8'), COMPRESSION)
+        with self.writer:
+            self.writer.execute('INSERT OR REPLACE INTO forecasts (city_key, days, fetched, forecast) VALUES (?, ?, ?, ?)',
+                            (normalize_city(city), days, time.time() if fetched is None else fetched, blob))
+
+    def compact(self) -> int:
+        '''
+        Deletes the forecasts older than max_stale, then the least recently fetched ones over max_cities.
+        Returns how many were deleted.
+        '''
+        with self.writer:
+            expired = self.writer.execute('DELETE FROM forecasts WHERE fetched < ?', (time.time() - self.max_stale,)).rowcount
+            over = self.writer.execute('DELETE FROM forecasts WHERE city_key IN '
+                                   '(SELECT city_key FROM forecasts ORDER BY fetched DESC LIMIT -1 OFFSET ?)', (self.max_cities,)).rowcount
+
+        self.writer.execute('PRAGMA wal_checkpoint(TRUNCATE)')                                              # so the write-ahead log doesn't keep growing either
+        self.deleted += expired + over
+        return expired + over
+
+    def close(self) -> None:
+        self.writer.close()
+        self.db.close()
@@ -0,0 +1,96 @@
+###### DESCRIPTION #################################################
+### The ways a finished card can be encoded before it's uploaded. The default is the same plain PNG as always,
+### but the cards are mostly big flat colours, so a palette PNG or a WebP is a lot smaller and quicker to upload.
+### DEFAULT is used whenever no encoding is given, and can be changed to switch every card at once.
+###
+### Run this script to measure how long each encoding takes and how big the cards come out.
+
+
+###### IMPORTS #################################################
+from enum import Enum                                                                                   # same idea as text.Font
+from io import BytesIO                                                                                  # the cards are saved to memory, never to disk
+from PIL import Image
+import metrics                                                                                          # timing the encode stage
+
+
+###### ENCODINGS #################################################
+class Encoding(Enum):
+    #                 format    file ext    palette colours     PIL save() options
+    PNG             = ('PNG',   'png',      None,               {})                                     # PIL's defaults (zlib level 6)
+    PNG_FAST        = ('PNG',   'png',      None,               {'compress_level': 1})
+    PNG_OPTIMIZED   = ('PNG',   'png',      None,               {'optimize': True})
+    PNG_PALETTE     = ('PNG',   'png',      128,                {'optimize': True})                     # quantized to a 128 colour palette first
+    WEBP            = ('WEBP',  'webp',     None,               {'lossless': True, 'method': 4})
+    WEBP_LOSSY      = ('WEBP',  'webp',     None,               {'quality': 90, 'method': 4})
+    JPEG            = ('JPEG',  'jpg',      None,               {'quality': 90, 'optimize': True})      # no transparency
+
+    @property
+    def format(self) -> str:
+        return self.value[0]
+
+    @property
+    def extension(self) -> str:
+        return self.value[1]
+
+    # Filename to upload the card as, so Discord knows what kind of image it is
+    def filename(self, name:str='weather_report') -> str:
+        return f'{name}.{self.extension}'
+
+
+DEFAULT = Encoding.PNG                                                                                  # used when no encoding is given
+JPEG_BACKGROUND = (38, 32, 44)                                                                          # what transparent cards are flattened onto for JPEG (dark, like Discord)
+
+
+###### HELPERS #################################################
+# Picks the given encoding, or the default one
+def resolve(encoding:Encoding=None) -> Encoding:
+    return DEFAULT if encoding is None else encoding
+
+def encode(canvas:Image, encoding:Encoding=None) -> BytesIO:
+    '''
+    Saves a finished card to memory in the given encoding.
+
+    canvas: The Image object where the weather card was drawn
+    encoding: one of the Encoding options, or None for the DEFAULT
+    '''
+    encoding = resolve(encoding)
+    _, _, palette_colours, options = encoding.value
+
+    with metrics.stage('encode'):
+        if encoding.format == 'JPEG' and canvas.mode != 'RGB':                                          # JPEG has no alpha channel, so flattening it first
+            background = Image.new('RGB', canvas.size, JPEG_BACKGROUND)
+            background.paste(canvas, mask=canvas.getchannel('A') if 'A' in canvas.getbands() else None)
+            canvas = background
+
+        if palette_colours:                                                                             # fast octree is the only PIL quantizer that keeps the alpha channel
+            canvas = canvas.quantize(colors=palette_colours, method=Image.Quantize.FASTOCTREE)
+
+        weather_card = BytesIO()
+        canvas.save(weather_card, format=encoding.format, **options)
+
+    return weather_card
+
+
+###### MEASUREMENTS #################################################
+if __name__ == '__main__':
+    import time
+    import pill
+
+    RUNS = 5
+    TEMPS = ['19º', '23º', '26º', '25º', '21º', '18º']
+    CODES = ['113', '116', '113', '119', '116', '999']
+    CARDS = {                                                                                           # drawn once, then only the encoding is timed
+        'hourly':           pill.draw_weather_card_hourly('LOS ANGELES', '24º', '113', '14:37', TEMPS, CODES, 200),
+        'forecast':         pill.draw_tomorrow_forecast('LOS ANGELES', '22º', '116', 'AUGUST 22', TEMPS, CODES, False),
+        'forecast_dark':    pill.draw_tomorrow_forecast('LOS ANGELES', '22º', '116', 'AUGUST 22', TEMPS, CODES, True),
+    }
+
+    print(f'{"card":<16}{"encoding":<16}{"ms":>8}{"KB":>8}')
+    for card, canvas in CARDS.items():
+        for encoding in Encoding:
+            start = time.perf_counter()
+            for _ in range(RUNS):
+                size = len(encode(canvas, encoding).getvalue())
+            ms = (time.perf_counter() - start) / RUNS * 1000
+
+            print(f'{card:<16}{encoding.name:<16}{ms:>8.1f}{size / 1024:>8.1f}')
@@ -0,0 +1,93 @@
+###### DESCRIPTION #################################################
+### Non-blocking HTTP layer for the weather APIs. Every request goes through one shared aiohttp session,
+### which keeps a pool of keep-alive connections open, so that lots of slash commands can be waiting on
+### weatherapi.com and wttr.in at the same time without freezing the Discord event loop.
+
+
+###### IMPORTS #################################################
+import asyncio                                                                                          # sleeping between retries without blocking the bot
+import aiohttp                                                                                          # async HTTP client (discord.py already depends on it)
+import scheduler                                                                                        # rate limits and priorities of the weather APIs
+
+
+###### CONSTANTS #################################################
+POOL_SIZE           = 32                                                                                # max number of open connections in total
+POOL_SIZE_PER_HOST  = 16                                                                                # max number of open connections to the same API
+KEEPALIVE           = 30                                                                                # seconds an idle connection is kept around for reuse
+TIMEOUT             = aiohttp.ClientTimeout(total=10, connect=3)                                        # give up on a request after 10s (3s to connect)
+RETRIES             = 2                                                                                 # how many times a failed request is tried again
+RETRY_DELAY         = 0.5                                                                               # seconds to wait before the first retry, doubled after each one
+RETRY_STATUS        = {429, 500, 502, 503, 504}                                                         # HTTP statuses worth retrying (rate limited or server hiccups)
+
+_session: aiohttp.ClientSession = None                                                                  # the shared session, created on first use inside the running event loop
+
+
+###### SESSION #################################################
+def get_session() -> aiohttp.ClientSession:
+    '''
+    Returns the shared client session, creating it (and its connection pool) the first time it's needed.
+    Must be called from inside the running event loop.
+    '''
+    global _session
+
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=POOL_SIZE, limit_per_host=POOL_SIZE_PER_HOST, keepalive_timeout=KEEPALIVE, ttl_dns_cache=300)
+        _session = aiohttp.ClientSession(connector=connector, timeout=TIMEOUT)
+
+    return _session
+
+async def close():
+    '''
+    Closes the shared session and all of its pooled connections.
+    '''
+    global _session
+
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+###### REQUESTS #################################################
+# The Retry-After header of a 429 response in seconds, or None if it's missing or an HTTP date
+def get_retry_after(response) -> float:
+    try:
+        return float(response.headers['Retry-After'])
+    except (KeyError, ValueError):
+        return None
+
+async def get_json(url:str, provider:str=None, priority=scheduler.INTERACTIVE) -> dict:
+    '''
+    GETs a URL and returns the decoded JSON body, retrying with exponential backoff on timeouts,
+    dropped connections, and 429/5xx responses.
+
+    url: the full URL to request
+    provider: scheduler provider whose rate limit the request (and each retry) waits for, None to send it right away
+    priority: scheduler.INTERACTIVE or scheduler.BATCH, which requests go first when the provider is busy
+    '''
+    for attempt in range(RETRIES + 1):
+        last_try = attempt == RETRIES
+
+        if provider is not None:
+            await scheduler.acquire(provider, priority)
+
+        try:
+            async with get_session().get(url) as response:
+                if response.status == 429 and provider is not None:                                     # the scheduler pauses everyone's requests to this API
+                    scheduler.throttle(provider, get_retry_after(response))
+                    if not last_try:
+                        continue
+
+                if response.status in RETRY_STATUS and not last_try:                                    # try again later instead of raising straight away
+                    await asyncio.sleep(RETRY_DELAY * 2**attempt)
+                    continue
+
+                response.raise_for_status()
+                if provider is not None:
+                    scheduler.succeeded(provider)
+
+                return await response.json(content_type=None)                                           # wttr.in doesn't always send an application/json content type
+
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if last_try:
+                raise
+            await asyncio.sleep(RETRY_DELAY * 2**attempt)
@@ -0,0 +1,83 @@
+###### DESCRIPTION #################################################
+### In-process cache of weatherapi.com forecasts so /weather, /forecast and the daily job can share one download per city.
+### Entries expire after a TTL and the least recently used city is evicted once the cache is full.
+
+
+###### IMPORTS #################################################
+from collections import OrderedDict                                                                     # keeps entries in least -> most recently used order
+import time                                                                                             # monotonic clock for expiry
+import gazetteer                                                                                        # offline city index, so every spelling of a city shares a key
+
+
+###### CONSTANTS #################################################
+FORECAST_TTL        = 10 * 60                                                                           # seconds a forecast stays fresh (weatherapi updates every 15 mins or so)
+FORECAST_CACHE_SIZE = 256                                                                               # max number of cities kept in memory
+
+
+###### HELPERS #################################################
+# Turns user input like " new  York", "NYC" or "Köln" into the same cache key as "New York" and "Cologne"
+def normalize_city(city:str) -> str:
+    return gazetteer.location_key(city)
+
+
+###### CACHE #################################################
+class ForecastCache:
+    '''
+    A TTL + LRU cache of forecast payloads keyed by the gazetteer's location key.
+
+    ttl: seconds before an entry is considered stale
+    max_size: max amount of cities kept, the least recently used one is evicted first
+    '''
+    def __init__(self, ttl:float=FORECAST_TTL, max_size:int=FORECAST_CACHE_SIZE) -> None:
+        self.ttl        = ttl
+        self.max_size   = max_size
+        self.hits       = 0
+        self.misses     = 0
+        self._entries   = OrderedDict()                                                                 # key -> (expiry time, payload)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, city:str):
+        '''
+        Returns the cached payload for a city, or None if it's missing or expired.
+        '''
+        key = normalize_city(city)
+        entry = self._entries.get(key)
+
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:                                                                       # dropping expired entries as we find them
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)                                                                  # marking it as the most recently used
+        self.hits += 1
+        return entry[1]
+
+    def put(self, city:str, payload, ttl:float=None) -> None:
+        '''
+        Stores a payload for a city, evicting the least recently used cities if the cache is full.
+
+        ttl: seconds it stays fresh, if not the cache's own TTL (like a forecast that was already fetched a while ago)
+        '''
+        key = normalize_city(city)
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), payload)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def peek(self, city:str) -> tuple:
+        '''
+        Returns (seconds until it expires, payload) for a city without counting a hit or touching its LRU position,
+        or None if it isn't cached. The seconds are negative if it has already expired.
+        '''
+        entry = self._entries.get(normalize_city(city))
+        if entry is None:
+            return None
+
+        return entry[0] - time.monotonic(), entry[1]
+
+    def clear(self) -> None:
+        self._entries.clear()
@@ -0,0 +1,156 @@
+###### DESCRIPTION #################################################
+### The parts of a forecast the cards actually show, read out of the JSON once when it's downloaded.
+### The full payload is ~3 days x 24 hours of nested dicts, but a card only needs the current conditions and six hours
+### per day, so that's all that gets kept (and cached): a few small __slots__ records with the values already formatted
+### the way pill draws them. weatherapi.com and wttr.in payloads are both read into the same records (both use the WWO
+### condition codes of weather_codes.WWO_CODE), so the cards don't care which API a forecast came from.
+
+
+###### IMPORTS #################################################
+from datetime import datetime                                                                           # formatting the dates
+import json                                                                                             # storing forecasts on disk
+
+
+###### CONSTANTS #################################################
+HOURS = [9, 12, 15, 18, 21, 23]                                                                         # we only want 9AM, 12PM, 3PM, 6PM, 9PM, and 12AM
+
+
+###### HELPERS #################################################
+# Rounds a temperature (a number, or a string from wttr.in) to full digit and adds the degree symbol
+def format_temp(temp) -> str:
+    return f'{round(float(temp))}º'
+
+# Gets the URL to the icon from weatherapi.com and extracts only the 3 digit icon code
+def get_code_from_json(forecast) -> str:
+    code = forecast['condition']['icon'][-7:-4]
+    return code
+
+# Gets temperature forecast from weatherapi, rounds it to full digit and adds degree symbol
+def get_temp(forecast) -> str:
+    temp = forecast.get('temp_c')
+    if temp is None:                                                                                    # the daily summaries don't have one
+        temp = forecast['feelslike_c']
+
+    return format_temp(temp)
+
+# Getting forecasted temperature and condition at specified hours
+def get_hourly_forecast(forecast_dict:dict):
+    temps = [get_temp(forecast_dict[x]) for x in HOURS]                                                 # getting the temperature forecast at each hour specified, rounded to full digit
+    codes = [get_code_from_json(forecast_dict[x]) for x in HOURS]                                       # getting the forecast condition code
+    codes[-1] = '999'                                                                                   # hardcoding the code at 12AM to be the Moon
+
+    return temps, codes
+
+# Taking a YYYY-MM-DD date string and formatting it as MONTH day (AUGUST 21)
+def get_formatted_date(date_str:str) -> str:
+    date = datetime.strptime(date_str, '%Y-%m-%d')                                                      # converting the date to datetime so that we can format it differently
+    date_formatted = date.strftime('%B %d').upper()                                                     # formatting the date as AUGUST 21 (month_name day)
+
+    return date_formatted
+
+
+###### MODEL #################################################
+class ForecastDay:
+    '''
+    One day of forecast, as the forecast panels show it.
+
+    avg_temp: average temperature, like '21º'
+    code: 3 digit condition code of the day
+    date: formatted date, like 'AUGUST 21'
+    hourly_temps: temperatures at each of HOURS
+    hourly_codes: condition codes at each of HOURS (the last one is always the Moon)
+    '''
+    __slots__ = ('avg_temp', 'code', 'date', 'hourly_temps', 'hourly_codes')
+
+    def __init__(self, avg_temp:str, code:str, date:str, hourly_temps:tuple, hourly_codes:tuple) -> None:
+        self.avg_temp       = avg_temp
+        self.code           = code
+        self.date           = date
+        self.hourly_temps   = hourly_temps
+        self.hourly_codes   = hourly_codes
+
+    @classmethod
+    def from_weatherapi(cls, forecast:dict):
+        '''
+        forecast: one of the data['forecast']['forecastday'] elements
+        '''
+        temps, codes = get_hourly_forecast(forecast['hour'])
+        return cls(format_temp(forecast['day']['avgtemp_c']), get_code_from_json(forecast['day']), get_formatted_date(forecast['date']),
+                   tuple(temps), tuple(codes))
+
+    @classmethod
+    def from_wttr(cls, forecast:dict):
+        '''
+        forecast: one of the data['weather'] elements of a wttr.in (format=j1) response
+        '''
+        hourly = {int(hour['time']) // 100: hour for hour in forecast['hourly']}                         # wttr.in only has every 3 hours, 0 to 21
+        hours = [hourly.get(x) or hourly[x - x % 3] for x in HOURS]                                     # so 11PM is the 9PM one
+
+        temps = tuple(format_temp(hour['tempC']) for hour in hours)
+        codes = tuple(hour['weatherCode'] for hour in hours[:-1]) + ('999',)                            # the Moon at 12AM, like get_hourly_forecast()
+        code = hourly[12]['weatherCode']                                                                # there's no condition for the whole day, midday's will do
+
+        return cls(format_temp(forecast['avgtempC']), code, get_formatted_date(forecast['date']), temps, codes)
+
+
+class Forecast:
+    '''
+    Everything the cards need from one weatherapi.com or wttr.in payload.
+
+    name: city name the API matched
+    tz_id: IANA time zone of the city, like 'Europe/Berlin' (None from wttr.in, which doesn't say)
+    local_time: local time when the payload was made, 'HH:MM' (weatherapi leaves out the leading zero, so it can be ' 9:05')
+    current_temp: current temperature, like '21º'
+    current_code: current 3 digit condition code
+    feels_like: current feels like temperature in ºC, rounded
+    days: ForecastDay of today and the following days
+    '''
+    __slots__ = ('name', 'tz_id', 'local_time', 'current_temp', 'current_code', 'feels_like', 'days')
+
+    def __init__(self, name:str, tz_id:str, local_time:str, current_temp:str, current_code:str, feels_like:int, days:tuple) -> None:
+        self.name           = name
+        self.tz_id          = tz_id
+        self.local_time     = local_time
+        self.current_temp   = current_temp
+        self.current_code   = current_code
+        self.feels_like     = feels_like
+        self.days           = days
+
+    @classmethod
+    def from_weatherapi(cls, data:dict):
+        '''
+        Reads a weatherapi.com forecast JSON response.
+        '''
+        location = data['location']
+        current = data['current']
+        days = tuple(ForecastDay.from_weatherapi(forecast) for forecast in data['forecast']['forecastday'])
+
+        return cls(location['name'], location.get('tz_id'), location['localtime'][-5:], get_temp(current), get_code_from_json(current),
+                   round(current['feelslike_c']), days)
+
+    @classmethod
+    def from_wttr(cls, data:dict):
+        '''
+        Reads a wttr.in JSON response (format=j1).
+        '''
+        current = data['current_condition'][0]
+        local_time = datetime.strptime(current['localObsDateTime'][11:], '%I:%M %p').strftime('%H:%M')   # like '02:37 PM'
+        days = tuple(ForecastDay.from_wttr(forecast) for forecast in data['weather'])
+
+        return cls(data['nearest_area'][0]['areaName'][0]['value'], None, local_time, format_temp(current['temp_C']), current['weatherCode'],
+                   round(float(current['FeelsLikeC'])), days)
+
+    def to_json(self) -> str:
+        '''
+        Compact JSON of the forecast, read back with from_json().
+        '''
+        days = [[day.avg_temp, day.code, day.date, day.hourly_temps, day.hourly_codes] for day in self.days]
+        return json.dumps([self.name, self.tz_id, self.local_time, self.current_temp, self.current_code, self.feels_like, days],
+                          ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, text:str):
+        name, tz_id, local_time, current_temp, current_code, feels_like, days = json.loads(text)
+        days = tuple(ForecastDay(avg_temp, code, date, tuple(temps), tuple(codes)) for avg_temp, code, date, temps, codes in days)
+
+        return cls(name, tz_id, local_time, current_temp, current_code, feels_like, days)
@@ -0,0 +1,177 @@
+###### DESCRIPTION #################################################
+### Offline index of the cities people ask for (data/cities.csv), so "cologne", "Cologne " and "Köln" all become the same
+### city before anything is cached or fetched. Every name and alias is normalized (no accents, no punctuation, lowercase) and
+### kept in a sorted array, which gives exact lookups with a dict and prefix searches for autocomplete with a binary search.
+### Typos are matched to the closest known name, and cities that aren't in the list pass through as typed (just cleaned up).
+###
+### Run this script with a few names to see what they resolve to.
+
+
+###### IMPORTS #################################################
+from bisect import bisect_left                                                                          # prefix search over the sorted names
+import csv
+from difflib import get_close_matches                                                                   # fixing typos like "Colgone"
+from functools import lru_cache                                                                         # the same few cities get looked up over and over
+import unicodedata                                                                                      # stripping accents ("Köln" -> "koln")
+import resources                                                                                        # the index is loaded lazily like the other assets
+
+
+###### CONSTANTS #################################################
+CITIES_FILE         = 'data/cities.csv'                                                                 # name,country,aliases (aliases separated by |)
+AUTOCOMPLETE_LIMIT  = 25                                                                                # Discord shows at most 25 autocomplete choices
+TYPO_CUTOFF         = 0.85                                                                              # how similar (0-1) a typo has to be to a known name to be corrected
+TYPO_MIN_LENGTH     = 5                                                                                 # shorter names are too likely to be real places that aren't in the list ("Lees" isn't "Leeds")
+
+
+###### HELPERS #################################################
+# Turns " Köln", "KOELN." or "St. Louis" into "koln", "koeln" and "st louis"
+def normalize(text:str) -> str:
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c if c.isalnum() else ' ' for c in text if not unicodedata.combining(c))
+
+    return ' '.join(text.casefold().split())
+
+
+###### INDEX #################################################
+class City:
+    '''
+    A city of the gazetteer.
+
+    name: canonical name, shown on the cards
+    country: country it's in, sent along to the APIs so they pick the right one
+    '''
+    __slots__ = ('name', 'country', 'key')
+
+    def __init__(self, name:str, country:str) -> None:
+        self.name       = name
+        self.country    = country
+        self.key        = normalize(name)                                                               # stable location key for the caches and the subscribers
+
+    def __repr__(self) -> str:
+        return f'City({self.name!r}, {self.country!r})'
+
+    @property
+    def query(self) -> str:
+        return f'{self.name}, {self.country}'
+
+
+class Gazetteer:
+    '''
+    Sorted index of city names and aliases.
+
+    cities: list of (City, [aliases])
+    '''
+    def __init__(self, cities:list) -> None:
+        self.cities = [city for city, _ in cities]
+        self._names = {}                                                                                # normalized name or alias -> City
+
+        for city, aliases in cities:
+            for name in [city.name] + aliases:
+                self._names.setdefault(normalize(name), city)
+
+        self._sorted = sorted(self._names)                                                              # the same names, sorted for the prefix search
+
+    def __len__(self) -> int:
+        return len(self.cities)
+
+    @classmethod
+    def load(cls, path:str=CITIES_FILE):
+        with open(path, newline='', encoding='utf-8') as f:
+            rows = [(City(row['name'], row['country']), [a for a in row['aliases'].split('|') if a]) for row in csv.DictReader(f)]
+
+        return cls(rows)
+
+    def lookup(self, query:str) -> City:
+        '''
+        Returns the city a query refers to, correcting small typos, or None if it isn't in the index.
+        '''
+        name = normalize(query)
+
+        city = self._names.get(name)
+        if city is None and len(name) >= TYPO_MIN_LENGTH:
+            match = get_close_matches(name, self._sorted, n=1, cutoff=TYPO_CUTOFF)
+            if match:
+                city = self._names[match[0]]
+
+        return city
+
+    # Whether a query is exactly one of the names or aliases, rather than a typo of one
+    def knows(self, query:str) -> bool:
+        return normalize(query) in self._names
+
+    def complete(self, prefix:str, limit:int=AUTOCOMPLETE_LIMIT) -> list:
+        '''
+        Returns up to `limit` cities with a name or alias starting with the prefix, in alphabetical order of the match.
+        '''
+        prefix = normalize(prefix)
+        found = []
+
+        for i in range(bisect_left(self._sorted, prefix), len(self._sorted)):
+            name = self._sorted[i]
+            if not name.startswith(prefix) or len(found) >= limit:
+                break
+
+            city = self._names[name]
+            if city not in found:                                                                       # a city and its alias can both match
+                found.append(city)
+
+        return found
+
+resources.register('gazetteer', Gazetteer.load)
+
+
+###### LOOKUPS #################################################
+@lru_cache(maxsize=4096)
+def lookup(query:str) -> City:
+    '''
+    Returns the gazetteer's City for a query (name, alias or typo of one), or None for cities it doesn't know.
+    '''
+    return resources.get('gazetteer').lookup(query)
+
+def canonical(query:str) -> str:
+    '''
+    Returns the name to show for a city: the canonical name if it's known, or the query cleaned up if it isn't.
+    '''
+    city = lookup(query)
+    return city.name if city is not None else ' '.join(query.split())
+
+def corrected(query:str) -> str:
+    '''
+    Returns the canonical name a query was corrected to if it was a typo of a known city, or None if it wasn't corrected.
+    '''
+    city = lookup(query)
+    return city.name if city is not None and not resources.get('gazetteer').knows(query) else None
+
+def location_key(query:str) -> str:
+    '''
+    Returns the key caches and subscriptions group a city by, the same for every way of writing it.
+    '''
+    city = lookup(query)
+    return city.key if city is not None else normalize(query)
+
+def api_query(query:str) -> str:
+    '''
+    Returns what to send to the weather APIs for a city, with its country if it's known.
+    '''
+    city = lookup(query)
+    return city.query if city is not None else ' '.join(query.split())
+
+def autocomplete(prefix:str, limit:int=AUTOCOMPLETE_LIMIT) -> list:
+    '''
+    Returns the names of up to `limit` known cities starting with the prefix (or one of their aliases).
+    '''
+    return [city.name for city in resources.get('gazetteer').complete(prefix, limit)]
+
+
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    for query in sys.argv[1:] or ['cologne', 'Cologne ', 'Köln', 'Colgone', 'Lees', 'NYC', 'st. louis', 'Smallville']:
+        start = time.perf_counter()
+        key = location_key(query)
+        print(f'{query!r:>14} -> {canonical(query)!r:<18} key={key!r:<16} query={api_query(query)!r:<38} ({(time.perf_counter() - start) * 1e6:.0f}µs)')
+
+    print('autocomplete("san"):', autocomplete('san'))
@@ -0,0 +1,80 @@
+###### DESCRIPTION #################################################
+### Keeps every weather icon in memory after it's been decoded once, along with its recoloured versions,
+### so rendering a card doesn't have to open PNGs from disk or run NumPy over them every time.
+
+
+###### IMPORTS #################################################
+from functools import lru_cache                                                                         # memoizing the decoded and recoloured icons
+import os                                                                                               # checking which icons actually exist
+from PIL import Image                                                                                   # decoding the icons
+
+
+###### CONSTANTS #################################################
+ICON_PATHS = {
+    None:   'icons/{}.png',                                                                             # the big 800x800 icons of the current condition
+    64:     'icons/64/{}.png',                                                                          # the small mono icons of the hourly forecasts
+    128:    'icons/128/{}.png',                                                                         # the mono icon of tomorrow's condition
+}
+
+
+###### ATLAS #################################################
+# Whether there is an icon for that condition at that size (not every size has every icon)
+@lru_cache(maxsize=None)
+def exists(name:str, size:int=None) -> bool:
+    return os.path.exists(ICON_PATHS[size].format(name))
+
+@lru_cache(maxsize=None)
+def icon(name:str, size:int=None) -> Image:
+    '''
+    Returns a decoded icon. The image is shared between renders, so only paste it, never draw on it.
+
+    name: name of the icon (from weather_codes.WWO_CODE)
+    size: 64 or 128 for the small mono icons (as RGBA), None for the big colour ones (as they are)
+    '''
+    image = Image.open(ICON_PATHS[size].format(name))
+
+    if size is not None:
+        return image.convert('RGBA')                                                                    # converting to transparent format
+
+    image.load()                                                                                        # decoding it now instead of on first paste
+    return image
+
+_recoloured = {}                                                                                        # (name, size, old colour, new colour) -> recoloured icon
+
+def recoloured(name:str, size:int, old_colour:tuple, new_colour:tuple) -> Image:
+    '''
+    Returns a mono icon tinted a new colour (edges and shading included). Shared between renders like icon().
+
+    name: name of the icon (from weather_codes.WWO_CODE)
+    size: 64 or 128
+    old_colour: (R, G, B) colour of the icon as drawn
+    new_colour: (R, G, B) colour to tint it
+    '''
+    key = (name, size, tuple(old_colour), tuple(new_colour))
+
+    if key not in _recoloured:
+        import recolour                                                                                 # My script to recolour imagines using PIL and NumPy (imported here so NumPy only loads when needed)
+        _recoloured[key] = recolour.tint(icon(name, size), new_colour, old_colour)
+
+    return _recoloured[key]
+
+def warm_recoloured(size:int, old_colour:tuple, variants:list) -> None:
+    '''
+    Builds lots of recoloured icons in a single vectorized pass and stores them for recoloured().
+
+    size: 64 or 128
+    old_colour: (R, G, B) colour of the icons as drawn
+    variants: list of (icon name, (R, G, B) new colour) pairs
+    '''
+    import recolour
+
+    variants = [(name, tuple(colour)) for name, colour in variants if (name, size, tuple(old_colour), tuple(colour)) not in _recoloured]
+    if not variants:
+        return
+
+    icons = [icon(name, size) for name, _ in variants]
+    data = recolour.stack(icons)
+    recolour.tint_batch(data, [colour for _, colour in variants], old_colour, out=data)                # tinting the whole stack in place
+
+    for (name, colour), image in zip(variants, recolour.unstack(data, [i.size for i in icons])):
+        _recoloured[(name, size, tuple(old_colour), colour)] = image
@@ -0,0 +1,447 @@
+###### DESCRIPTION #################################################
+### The weather cards described as data. A Layout says what a card is made of: a background, static layers on top of it,
+### and the slots filled in on every request (texts, rows of hourly temperatures, icons, rows of icons, the progress marker).
+###
+### Each layout is compiled once per process into a RenderPlan (lazily, through resources, so the render workers compile
+### them all when they warm up). Compiling composites the background and the static layers into a single base image and
+### resolves every slot's position, colour and icon tint up front, so a render is only pastes. Every render also records
+### the regions its slots touched, and render_reused() draws the next card on the same canvas by restoring only those
+### regions from the base instead of copying the whole template. render_stacked() draws several cards of a plan on top of
+### each other (the multi-day forecast) the same way, on a canvas of the base repeated, copying over only what each one drew.
+### A new card is just a new Layout and register().
+
+
+###### IMPORTS #################################################
+import threading                                                                                        # every thread reuses its own canvas
+from PIL import Image, ImageColor
+from text import Font                                                                                   # My own Enumerator of Fonts
+import weather_codes                                                                                    # condition codes -> icon names and accent colours
+import icon_atlas                                                                                       # the decoded and recoloured icons
+import resources                                                                                        # templates and compiled plans, loaded on first use
+import text_sprites                                                                                     # pre-rendered text masks
+
+
+###### CONSTANTS #################################################
+ACCENT          = 'accent'                                                                              # colour of a slot drawn in the accent colour of the card's condition
+
+CANVAS_SIZE     = (1000, 1100)                                                                          # the blank canvas of the simplified card
+BG_COLOUR       = (255, 255, 255)
+MODE            = 'RGB'
+ICON_POS        = (100, 200)                                                                            # position of the big condition icon
+BIG_ICON_SIZE   = (800, 800)                                                                            # size of every big icon
+
+ICON_COLOUR     = (248,252,254)                                                                         # the shade of white used by all 128x128 the mono icons
+ICON_COLOUR_64  = (250, 253, 255)                                                                       # the shade of white used by all 64x64 the mono icons (they're accidentally different but it's too annoying to fix that)
+MONO_COLOURS    = {64: ICON_COLOUR_64, 128: ICON_COLOUR}                                                # size -> colour the mono icons are drawn in
+
+TEMPLATE        = 'templates/hourly.png'                                                                # the hourly card
+MARKER          = 'templates/marker.png'                                                                # the daily progress marker
+FORECAST        = 'templates/forecast_light.png'                                                        # tomorrow's forecast, light mode
+DARK_FORECAST   = 'templates/forecast_trans.png'                                                        # tomorrow's forecast, transparent dark mode
+
+HOURLY_ICONS_X  = [134, 267, 400, 533, 666, 799]                                                        # positions of the 64px icons in the x-axis
+HOURLY_TEMPS_X  = [171, 306, 439, 572, 705, 839]                                                        # positions of the hourly temperatures in the x-axis
+FORECAST_COLOURS    = ['#A5C3C8', '#65ADC4', '#FCC017', '#E19525', '#863C3D', '#26202C']                # colours of the hourly temperatures
+DARK_TXT_COLOUR     = '#DFDEDC'                                                                         # font colour for city name and date in dark mode
+DARK_COLOURS        = ['#A5C3C8', '#65ADC4', '#FCC017', '#E19525', '#863C3D', '#AC97BE']                # colours of the hourly icons and temperatures in dark mode
+DARK_FRCST_COLOURS  = [ImageColor.getcolor(x, 'RGB') for x in DARK_COLOURS]                             # colours converted to RGB for the recolouring
+
+
+###### HELPERS #################################################
+# Opens an image and decodes it straight away (used as a resource loader)
+def load_image(path:str, mode:str=None) -> Image:
+    image = Image.open(path)
+    image.load()
+
+    return image.convert(mode) if mode else image
+
+resources.register('template.hourly', lambda: load_image(TEMPLATE))
+resources.register('template.marker', lambda: load_image(MARKER, 'RGBA'))
+resources.register('template.forecast_light', lambda: load_image(FORECAST))
+resources.register('template.forecast_trans', lambda: load_image(DARK_FORECAST, 'RGBA'))
+
+# Smallest box around all of the boxes, a row restored in one paste is cheaper than each of its items
+def union(boxes:list) -> tuple:
+    lefts, tops, rights, bottoms = zip(*boxes)
+    return min(lefts), min(tops), max(rights), max(bottoms)
+
+# Names of the icons that exist at a size
+def icon_names(size:int=None) -> list:
+    return [name for name in sorted(set(weather_codes.WWO_CODE.values())) if icon_atlas.exists(name, size)]
+
+
+###### SLOTS #################################################
+### Every slot compiles into a function drawing its value on a canvas: draw(canvas, value, condition, dirty), where
+### condition is the icon name of the card's condition (for the ACCENT colour) and dirty the list of boxes it pasted over
+### (one per slot, so there are as few regions to restore as possible).
+class Slot:
+    '''
+    Something drawn on every render.
+
+    name: key of its value in RenderPlan.render()
+    '''
+    def __init__(self, name:str) -> None:
+        self.name = name
+
+    def compile(self, plan):
+        raise NotImplementedError
+
+    # Recoloured icons the slot can draw -> list of (size, [(icon name, (R, G, B) colour), ...])
+    def recolourings(self) -> list:
+        return []
+
+
+class TextSlot(Slot):
+    '''
+    A line of text.
+
+    position: (x, y) of its anchor point
+    font: text.Font to draw it in
+    colour: #Hex colour, or ACCENT
+    anchor: PIL text anchor
+    '''
+    def __init__(self, name:str, position:tuple, font:Font, colour:str=ACCENT, anchor:str='lm') -> None:
+        super().__init__(name)
+        self.position   = position
+        self.font       = font
+        self.colour     = colour
+        self.anchor     = anchor
+
+    def compile(self, plan):
+        (x, y), font, anchor = self.position, self.font, self.anchor
+        colour = None if self.colour == ACCENT else plan.colour(self.colour)
+        accents = plan.accents
+
+        def draw(canvas, text, condition, dirty):
+            mask, (dx, dy) = text_sprites.sprite(text, font, anchor)
+            box = (x + dx, y + dy, x + dx + mask.width, y + dy + mask.height)
+            dirty.append(box)
+            canvas.paste(colour or accents[condition], box, mask)
+
+        return draw
+
+
+class TextRowSlot(Slot):
+    '''
+    A row of texts, one per hour, each in its own colour.
+
+    xs: x of each text's anchor point
+    y: y of their anchor points
+    font: text.Font to draw them in
+    colours: #Hex colour of each text
+    anchor: PIL text anchor
+    '''
+    def __init__(self, name:str, xs:list, y:int, font:Font, colours:list, anchor:str='mm') -> None:
+        super().__init__(name)
+        self.xs         = xs
+        self.y          = y
+        self.font       = font
+        self.colours    = colours
+        self.anchor     = anchor
+
+    def compile(self, plan):
+        y, font, anchor = self.y, self.font, self.anchor
+        places = [(x, plan.colour(colour)) for x, colour in zip(self.xs, self.colours)]
+
+        def draw(canvas, texts, condition, dirty):
+            boxes = []
+            for (x, colour), text in zip(places, texts):
+                mask, (dx, dy) = text_sprites.sprite(text, font, anchor)
+                box = (x + dx, y + dy, x + dx + mask.width, y + dy + mask.height)
+                boxes.append(box)
+                canvas.paste(colour, box, mask)
+
+            if boxes:
+                dirty.append(union(boxes))
+
+        return draw
+
+
+class IconSlot(Slot):
+    '''
+    The icon of a condition code.
+
+    position: (x, y) of its top left corner
+    size: 64 or 128 for the mono icons, None for the big colour icons (pasted without a mask, they cover their whole box)
+    tint: None to keep the mono icon white, or ACCENT
+    '''
+    def __init__(self, name:str, position:tuple, size:int=None, tint:str=None) -> None:
+        super().__init__(name)
+        self.position   = position
+        self.size       = size
+        self.tint       = tint
+
+    def compile(self, plan):
+        position, size = self.position, self.size
+        x, y = position
+
+        if size is None:
+            cover = (x, y, x + BIG_ICON_SIZE[0], y + BIG_ICON_SIZE[1])
+            base = plan.base
+
+            def draw(canvas, code, condition, dirty):
+                icon = icon_atlas.icon(weather_codes.WWO_CODE[code])
+                if icon.size != BIG_ICON_SIZE:                                                          # one that doesn't cover the box, so the last icon is cleared first
+                    canvas.paste(base.crop(cover), position)
+                canvas.paste(icon, position)                                                            # the box is always painted over, so it's never dirty
+
+            return draw
+
+        tints = plan.accents_rgb if self.tint == ACCENT else None
+
+        def draw(canvas, code, condition, dirty):
+            name = weather_codes.WWO_CODE[code]
+            icon = icon_atlas.recoloured(name, size, MONO_COLOURS[size], tints[name]) if tints else icon_atlas.icon(name, size)
+            dirty.append((x, y, x + icon.width, y + icon.height))
+            canvas.paste(icon, position, mask=icon)
+
+        return draw
+
+    def recolourings(self) -> list:
+        if self.size is None or self.tint != ACCENT:
+            return []
+
+        names = [name for name in icon_names(self.size) if name in weather_codes.ACCENT_COLOUR]
+        return [(self.size, [(name, ImageColor.getcolor(weather_codes.ACCENT_COLOUR[name], 'RGB')) for name in names])]
+
+
+class IconRowSlot(Slot):
+    '''
+    A row of mono icons, one per hour.
+
+    xs: x of each icon's top left corner
+    y: y of their top left corners
+    size: 64 or 128
+    tints: (R, G, B) colour of each icon, or None to keep them white
+    '''
+    def __init__(self, name:str, xs:list, y:int, size:int=64, tints:list=None) -> None:
+        super().__init__(name)
+        self.xs         = xs
+        self.y          = y
+        self.size       = size
+        self.tints      = tints
+
+    def compile(self, plan):
+        y, size, old_colour = self.y, self.size, MONO_COLOURS[self.size]
+        places = list(zip(self.xs, self.tints or [None] * len(self.xs)))
+
+        def draw(canvas, codes, condition, dirty):
+            boxes = []
+            for (x, tint), code in zip(places, codes):
+                name = weather_codes.WWO_CODE[code]
+                icon = icon_atlas.recoloured(name, size, old_colour, tint) if tint else icon_atlas.icon(name, size)
+                boxes.append((x, y, x + icon.width, y + icon.height))
+                canvas.paste(icon, (x, y), mask=icon)
+
+            if boxes:
+                dirty.append(union(boxes))
+
+        return draw
+
+    def recolourings(self) -> list:
+        if not self.tints:
+            return []
+
+        return [(self.size, [(name, tint) for name in icon_names(self.size) for tint in self.tints])]
+
+
+class MarkerSlot(Slot):
+    '''
+    An image pasted at a different x on every render, like the daily progress marker on the timeline.
+
+    y: y of its top left corner
+    image: resource name of the RGBA image
+    '''
+    def __init__(self, name:str, y:int, image:str) -> None:
+        super().__init__(name)
+        self.y          = y
+        self.image      = image
+
+    def compile(self, plan):
+        y, marker = self.y, resources.get(self.image)
+
+        def draw(canvas, x, condition, dirty):
+            dirty.append((x, y, x + marker.width, y + marker.height))
+            canvas.paste(marker, (x, y), mask=marker)
+
+        return draw
+
+
+###### LAYOUTS #################################################
+class Layout:
+    '''
+    What a card is made of.
+
+    name: name of the card, its plan is the 'plan.<name>' resource
+    background: resource name of the template, or (mode, size, colour) of a blank canvas
+    slots: Slots drawn on every render, in order
+    layers: (resource name, (x, y)) of static images pasted on the background once, when the plan is compiled
+    accent: name of the slot whose condition code gives the ACCENT colour
+    '''
+    def __init__(self, name:str, background, slots:list, layers:list=(), accent:str=None) -> None:
+        self.name       = name
+        self.background = background
+        self.slots      = slots
+        self.layers     = layers
+        self.accent     = accent
+
+
+class RenderPlan:
+    '''
+    A Layout compiled for rendering: its static base image and a draw function per slot.
+    '''
+    def __init__(self, layout:Layout) -> None:
+        self.layout = layout
+
+        if isinstance(layout.background, str):
+            self.base = resources.get(layout.background).copy()
+        else:
+            self.base = Image.new(*layout.background)
+
+        for name, position in layout.layers:
+            layer = resources.get(name)
+            self.base.paste(layer, position, mask=layer if 'A' in layer.getbands() else None)
+
+        self.mode, self.size = self.base.mode, self.base.size
+        self.accents = {name: ImageColor.getcolor(colour, self.mode) for name, colour in weather_codes.ACCENT_COLOUR.items()}   # in the canvas' mode, for the texts
+        self.accents_rgb = {name: ImageColor.getcolor(colour, 'RGB') for name, colour in weather_codes.ACCENT_COLOUR.items()}  # for the recolouring
+
+        self.ops = [(slot.name, slot.compile(self)) for slot in layout.slots]
+        self._local = threading.local()                                                                 # every thread's reused canvas and its dirty boxes, and its stacks
+        self._stacked_bases = {}                                                                        # number of cards -> the base repeated that many times, see render_stacked()
+
+    # #Hex colour of a slot in the canvas' mode
+    def colour(self, colour:str) -> tuple:
+        return ImageColor.getcolor(colour, self.mode)
+
+    def draw(self, canvas:Image, values:dict, dirty:list) -> Image:
+        condition = weather_codes.WWO_CODE[values[self.layout.accent]] if self.layout.accent else None
+        for name, draw in self.ops:
+            draw(canvas, values[name], condition, dirty)
+
+        return canvas
+
+    def render(self, **values) -> Image:
+        '''
+        Draws the card on a copy of the base and returns it.
+
+        values: value of every slot, by name
+        '''
+        return self.draw(self.base.copy(), values, [])
+
+    def render_reused(self, **values) -> Image:
+        '''
+        Draws the card on this thread's canvas, only restoring the regions the last card drew over.
+        The canvas is only valid until the next render_reused() of this plan on the same thread, so encode it or paste it right away.
+
+        values: value of every slot, by name
+        '''
+        local = self._local
+        canvas = getattr(local, 'canvas', None)
+
+        if canvas is None:
+            canvas = local.canvas = self.base.copy()
+        else:
+            for box in local.dirty:
+                canvas.paste(self.base.crop(box), box[:2])                                              # (parts of a box outside the canvas are clipped by both)
+
+        local.dirty = []
+        return self.draw(canvas, values, local.dirty)
+
+    # The base repeated `count` times from top to bottom, made the first time that many cards are stacked
+    def stacked_base(self, count:int) -> Image:
+        base = self._stacked_bases.get(count)
+        if base is None:
+            width, height = self.size
+            base = Image.new(self.mode, (width, height * count))
+            for i in range(count):
+                base.paste(self.base, (0, i * height))
+            self._stacked_bases[count] = base                                                           # (two threads making it at once just make it twice)
+
+        return base
+
+    def render_stacked(self, cards:list, reuse=False) -> Image:
+        '''
+        Draws several cards on top of each other and returns the canvas. Every card is drawn with render_reused(), and only
+        the regions it touched (and the ones the last card in its place touched) are copied over a copy of stacked_base().
+
+        cards: values of every slot by name, one dict per card from top to bottom
+        reuse: Draw on this thread's stacked canvas for that many cards, only valid until its next render_stacked() (see render_reused())
+        '''
+        width, height = self.size
+        stacks = self._local.__dict__.setdefault('stacks', {}) if reuse else {}                         # number of cards -> (canvas, dirty boxes of each card)
+        stack = stacks.get(len(cards))
+
+        if stack is None:
+            stack = stacks[len(cards)] = (self.stacked_base(len(cards)).copy(), [[] for _ in cards])
+        canvas, dirty = stack
+
+        for i, values in enumerate(cards):
+            card = self.render_reused(**values)
+            boxes = [(max(x0, 0), max(y0, 0), min(x1, width), min(y1, height))                          # clipped to the card, so nothing spills into its neighbours
+                     for x0, y0, x1, y1 in dirty[i] + self._local.dirty]
+            for box in boxes:
+                if box[0] < box[2] and box[1] < box[3]:
+                    canvas.paste(card.crop(box), (box[0], box[1] + i * height))                         # everywhere else the card is the base, like the canvas
+            dirty[i] = list(self._local.dirty)
+
+        return canvas
+
+
+LAYOUTS = {}                                                                                            # name -> Layout
+
+def register(layout:Layout) -> None:
+    '''
+    Adds a card layout, compiled into its RenderPlan the first time it's used.
+    '''
+    LAYOUTS[layout.name] = layout
+    resources.register(f'plan.{layout.name}', lambda: RenderPlan(layout))
+
+def plan(name:str) -> RenderPlan:
+    return resources.get(f'plan.{name}')
+
+# Building every recoloured icon the layouts can draw up front, so no render has to touch the disk or NumPy
+def warm_icons() -> None:
+    for layout in LAYOUTS.values():
+        for slot in layout.slots:
+            for size, variants in slot.recolourings():
+                icon_atlas.warm_recoloured(size, MONO_COLOURS[size], variants)
+
+resources.register('icons', warm_icons)
+
+
+###### CARDS #################################################
+### The current conditions, the same on every card that has them
+def current_slots(subtitle_colour:str=ACCENT) -> list:
+    return [
+        TextSlot('city',        (100, 148), Font.BOLD_CONDENSED,    subtitle_colour),
+        TextSlot('temp',        (900, 132), Font.BOLD,              ACCENT,             anchor='rm'),
+        TextSlot('subtitle',    (100, 80),  Font.CONDENSED,         subtitle_colour),
+    ]
+
+register(Layout('simplified', (MODE, CANVAS_SIZE, BG_COLOUR), accent='condition', slots=[
+    IconSlot('condition',           ICON_POS),
+    *current_slots(),
+]))
+
+register(Layout('hourly', 'template.hourly', accent='condition', slots=[
+    IconSlot('condition',           ICON_POS),
+    IconRowSlot('hourly_codes',     HOURLY_ICONS_X, 1069),
+    *current_slots(),
+    TextRowSlot('hourly_temps',     HOURLY_TEMPS_X, 1183, Font.BOLD_SMALL, FORECAST_COLOURS),
+    MarkerSlot('progress',          1051, 'template.marker'),                                           # on top of the timeline
+]))
+
+register(Layout('tomorrow', 'template.forecast_light', accent='condition', slots=[
+    IconSlot('condition',           (540, 50), 128, tint=ACCENT),
+    IconRowSlot('hourly_codes',     HOURLY_ICONS_X, 264),
+    *current_slots(),
+    TextRowSlot('hourly_temps',     HOURLY_TEMPS_X, 375, Font.BOLD_SMALL, FORECAST_COLOURS),
+]))
+
+register(Layout('tomorrow_dark', 'template.forecast_trans', accent='condition', slots=[
+    IconSlot('condition',           (540, 50), 128, tint=ACCENT),
+    IconRowSlot('hourly_codes',     HOURLY_ICONS_X, 264, tints=DARK_FRCST_COLOURS),
+    *current_slots(DARK_TXT_COLOUR),
+    TextRowSlot('hourly_temps',     HOURLY_TEMPS_X, 375, Font.BOLD_SMALL, DARK_COLOURS),
+]))
@@ -0,0 +1,277 @@
+###### DESCRIPTION #################################################
+### Lightweight metrics for the bot: counters, gauges and latency histograms, cheap enough to leave on all the time
+### (a histogram observation is a binary search and an increment). They can be read as a Prometheus text page or as
+### a short human summary with the p50/p95/p99 of every histogram, for a periodic log dump.
+###
+### The stages of a card (fetch, parse, draw, encode, upload...) are timed with stage(). In the render workers the stage
+### timings are captured with capture() and sent back with the card, so they end up in the bot's own histograms.
+
+
+###### IMPORTS #################################################
+from bisect import bisect_left                                                                          # finding the histogram bucket
+from contextlib import contextmanager
+from contextvars import ContextVar                                                                      # which capture() the current stage belongs to, if any
+import time
+
+
+###### CONSTANTS #################################################
+BUCKETS = tuple(0.0001 * 2 ** (i / 2) for i in range(41))                                               # bucket upper bounds in seconds, 0.1ms to ~105s, each 1.41x the previous one
+QUANTILES = (0.5, 0.95, 0.99)
+
+_metrics    = {}                                                                                        # (name, labels) -> Counter, Gauge or Histogram
+_collectors = []                                                                                        # functions returning (name, labels, value) read when the metrics are exported
+_capture    = ContextVar('metrics_capture', default=None)                                               # dict of stage timings being captured, see capture()
+
+
+###### METRICS #################################################
+class Counter:
+    __slots__ = ('value',)
+    kind = 'counter'
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def inc(self, amount:float=1) -> None:
+        self.value += amount
+
+
+class Gauge:
+    __slots__ = ('value',)
+    kind = 'gauge'
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def set(self, value:float) -> None:
+        self.value = value
+
+    def inc(self, amount:float=1) -> None:
+        self.value += amount
+
+    def dec(self, amount:float=1) -> None:
+        self.value -= amount
+
+
+class Histogram:
+    '''
+    Counts of observations in logarithmic buckets (see BUCKETS), plus their count and sum.
+    '''
+    __slots__ = ('counts', 'count', 'sum')
+    kind = 'histogram'
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)                                                          # the last one is everything over the biggest bucket
+        self.count  = 0
+        self.sum    = 0.0
+
+    def observe(self, value:float) -> None:
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q:float) -> float:
+        '''
+        Estimates a quantile (0-1) by interpolating inside the bucket it falls in.
+        '''
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                low = BUCKETS[i - 1] if i > 0 else 0.0
+                high = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return low + (high - low) * (rank - seen) / n
+            seen += n
+
+        return BUCKETS[-1]
+
+
+def _get(cls, name:str, labels:dict):
+    key = (name, tuple(sorted(labels.items())))
+    metric = _metrics.get(key)
+
+    if metric is None:
+        metric = _metrics[key] = cls()
+
+    return metric
+
+def counter(name:str, **labels) -> Counter:
+    return _get(Counter, name, labels)
+
+def gauge(name:str, **labels) -> Gauge:
+    return _get(Gauge, name, labels)
+
+def histogram(name:str, **labels) -> Histogram:
+    return _get(Histogram, name, labels)
+
+def histograms(name:str) -> dict:
+    '''
+    Returns {labels dict as a sorted tuple: Histogram} of every histogram with that name.
+    '''
+    return {labels: metric for (n, labels), metric in _metrics.items() if n == name and metric.kind == 'histogram'}
+
+def register_collector(collector) -> None:
+    '''
+    Registers a function returning a list of (name, labels dict, value), for numbers that are already kept
+    somewhere else (cache hits, queue depths...) and only need to be read when the metrics are exported.
+    '''
+    _collectors.append(collector)
+
+def reset() -> None:
+    _metrics.clear()
+
+
+###### TIMING #################################################
+@contextmanager
+def timer(name:str, **labels):
+    '''
+    Observes how many seconds the block took in a histogram.
+    '''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram(name, **labels).observe(time.perf_counter() - start)
+
+@contextmanager
+def track(name:str, **labels):
+    '''
+    Times the block in the `<name>_seconds` histogram, counts it in `<name>_in_flight` while it runs,
+    and counts it in `<name>_errors_total` if it raises.
+    '''
+    in_flight = gauge(name + '_in_flight', **labels)
+    in_flight.inc()
+    start = time.perf_counter()
+
+    try:
+        yield
+    except BaseException:
+        counter(name + '_errors_total', **labels).inc()
+        raise
+    finally:
+        in_flight.dec()
+        histogram(name + '_seconds', **labels).observe(time.perf_counter() - start)
+
+@contextmanager
+def stage(name:str):
+    '''
+    Times one stage of making a card (fetch, parse, draw, encode, upload...) in the `stage_seconds` histogram,
+    or in the timings being captured (see capture()) if there are any.
+    '''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        captured = _capture.get()
+
+        if captured is None:
+            histogram('stage_seconds', stage=name).observe(seconds)
+        else:
+            captured[name] = captured.get(name, 0.0) + seconds
+
+@contextmanager
+def capture():
+    '''
+    Collects the timings of the stages run inside the block in a {stage: seconds} dict instead of recording them,
+    so a render worker can send them back to the bot with the card (see record_stages()).
+    '''
+    timings = {}
+    token = _capture.set(timings)
+    try:
+        yield timings
+    finally:
+        _capture.reset(token)
+
+def record_stages(timings:dict) -> None:
+    '''
+    Records stage timings captured somewhere else, like in a render worker.
+    '''
+    for name, seconds in timings.items():
+        histogram('stage_seconds', stage=name).observe(seconds)
+
+
+###### EXPORTING #################################################
+def _format_labels(labels, **extra) -> str:
+    labels = list(labels) + list(extra.items())
+    if not labels:
+        return ''
+
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+def _collected() -> list:
+    found = []
+    for collector in _collectors:
+        for name, labels, value in collector():
+            found.append((name, tuple(sorted(labels.items())), value))
+
+    return found
+
+def prometheus() -> str:
+    '''
+    Returns every metric in the Prometheus text exposition format.
+    '''
+    lines = []
+    typed = set()
+
+    for (name, labels), metric in sorted(_metrics.items(), key=lambda item: item[0]):
+        if name not in typed:
+            lines.append(f'# TYPE {name} {metric.kind}')
+            typed.add(name)
+
+        if metric.kind != 'histogram':
+            lines.append(f'{name}{_format_labels(labels)} {metric.value}')
+            continue
+
+        cumulative = 0
+        for bound, n in zip(BUCKETS, metric.counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{_format_labels(labels, le=f"{bound:.6g}")} {cumulative}')
+        lines.append(f'{name}_bucket{_format_labels(labels, le="+Inf")} {metric.count}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {metric.sum}')
+        lines.append(f'{name}_count{_format_labels(labels)} {metric.count}')
+
+    for name, labels, value in _collected():
+        if name not in typed:
+            lines.append(f'# TYPE {name} gauge')
+            typed.add(name)
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+
+    return '\n'.join(lines) + '\n'
+
+def summary() -> str:
+    '''
+    Returns a short human readable dump: p50/p95/p99 of every histogram in milliseconds, then the counters and gauges.
+    '''
+    lines = []
+
+    for (name, labels), metric in sorted(_metrics.items(), key=lambda item: item[0]):
+        if metric.kind == 'histogram' and metric.count:
+            quantiles = ' '.join(f'p{round(q * 100)} {metric.quantile(q) * 1000:.1f}ms' for q in QUANTILES)
+            lines.append(f'{name}{_format_labels(labels)}: {metric.count}x, {quantiles}')
+        elif metric.kind != 'histogram':
+            lines.append(f'{name}{_format_labels(labels)}: {metric.value:g}')
+
+    for name, labels, value in _collected():
+        lines.append(f'{name}{_format_labels(labels)}: {value:g}')
+
+    return '\n'.join(lines)
+
+async def serve(port:int, host:str='127.0.0.1'):
+    '''
+    Serves prometheus() on http://host:port/metrics from the running event loop. Returns the aiohttp runner (to stop it, call its cleanup()).
+    '''
+    from aiohttp import web                                                                             # only needed if the endpoint is turned on
+
+    async def handle(request):
+        return web.Response(text=prometheus(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+
+    return runner
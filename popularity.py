@@ -0,0 +1,87 @@
+###### DESCRIPTION #################################################
+### Which cities people ask for the most, right now. Every request adds 1 to its city's score, and scores decay exponentially
+### (halving every HALF_LIFE seconds), so a city that was busy this morning commute isn't still "hot" at midnight.
+### Only a bounded number of cities is tracked: once there are too many, the coldest ones are forgotten.
+### For each city it also remembers the last few kinds of cards that were asked for, so they can be rendered ahead of time.
+
+
+###### IMPORTS #################################################
+import heapq                                                                                            # picking the hottest cities
+import math
+import time                                                                                             # monotonic clock for the decay
+
+
+###### CONSTANTS #################################################
+HALF_LIFE           = 30 * 60                                                                           # seconds for a score to halve, about the length of a commute rush
+TRACKED_CITIES      = 512                                                                               # max cities kept, the coldest are dropped first
+VARIANTS_PER_CITY   = 4                                                                                 # max kinds of card remembered per city
+
+
+###### POPULARITY #################################################
+class Popularity:
+    '''
+    Exponentially decayed request counts per city, bounded to the hottest `capacity` cities.
+
+    half_life: seconds for a score to halve
+    capacity: max cities tracked
+    variants: max kinds of card remembered per city
+    '''
+    def __init__(self, half_life:float=HALF_LIFE, capacity:int=TRACKED_CITIES, variants:int=VARIANTS_PER_CITY) -> None:
+        self.decay      = math.log(2) / half_life
+        self.capacity   = capacity
+        self.variants   = variants
+        self._cities    = {}                                                                            # city key -> [score, last update, city name, [variants, most recent last]]
+
+    def __len__(self) -> int:
+        return len(self._cities)
+
+    def _decayed(self, entry:list, now:float) -> float:
+        return entry[0] * math.exp(-self.decay * (now - entry[1]))
+
+    def record(self, key:str, city:str, variant=None) -> None:
+        '''
+        Counts a request.
+
+        key: normalized city key
+        city: name to fetch the city with
+        variant: anything hashable describing the card that was asked for, remembered for pre-rendering
+        '''
+        now = time.monotonic()
+        entry = self._cities.get(key)
+
+        if entry is None:
+            entry = self._cities[key] = [0.0, now, city, []]
+            if len(self._cities) > 2 * self.capacity:                                                   # pruning in bulk so it's only done once in a while
+                self.prune(now)
+
+        entry[0] = self._decayed(entry, now) + 1
+        entry[1] = now
+
+        if variant is not None:
+            variants = entry[3]
+            if variant in variants:
+                variants.remove(variant)
+            variants.append(variant)
+            del variants[:-self.variants]
+
+    def prune(self, now:float=None) -> None:
+        '''
+        Forgets all but the `capacity` hottest cities.
+        '''
+        now = time.monotonic() if now is None else now
+        keep = heapq.nlargest(self.capacity, self._cities.items(), key=lambda item: self._decayed(item[1], now))
+        self._cities = dict(keep)
+
+    def score(self, key:str) -> float:
+        entry = self._cities.get(key)
+        return self._decayed(entry, time.monotonic()) if entry is not None else 0.0
+
+    def top(self, n:int, min_score:float=0.0) -> list:
+        '''
+        Returns (key, city, score, [variants]) of the `n` hottest cities with at least `min_score`, hottest first.
+        '''
+        now = time.monotonic()
+        scored = ((self._decayed(entry, now), key, entry) for key, entry in self._cities.items())
+        hottest = heapq.nlargest(n, (item for item in scored if item[0] >= min_score), key=lambda item: item[0])
+
+        return [(key, entry[2], score, list(entry[3])) for score, key, entry in hottest]
@@ -0,0 +1,247 @@
+###### DESCRIPTION #################################################
+### The weather APIs the forecasts come from, behind one interface: weatherapi.com and wttr.in are both read into a
+### forecast_model.Forecast, so any card can be made from either. Every request is timed, and the provider that's been
+### answering the fastest lately (rolling median of its last requests) is asked first.
+###
+### Slash commands are hedged: if the primary provider hasn't answered by the time it normally would have (the p90 of its
+### recent requests), the same request goes to the other one too and the first good answer wins. That cuts the tail latency
+### down to whichever API is having the better minute, for an extra request on the slow ones only. Background requests
+### (the daily job, the cache warmer) aren't in a hurry, so they only go to the other provider if the primary fails.
+
+
+###### IMPORTS #################################################
+import asyncio
+from collections import deque                                                                           # the latencies of the last requests
+import time
+import requests                                                                                         # the blocking requests, for the command line
+import fetch                                                                                            # async HTTP layer with pooled connections, for the bot
+import scheduler                                                                                        # rate limits of the weather APIs, and which requests go first
+import gazetteer                                                                                        # the city as each API wants it
+import metrics                                                                                          # how many requests get hedged, and which provider wins
+from forecast_model import Forecast                                                                     # what every provider's JSON is read into
+
+
+###### CONSTANTS #################################################
+LATENCY_WINDOW  = 64                                                                                    # latencies kept per provider
+MIN_SAMPLES     = 5                                                                                     # requests a provider needs before its latency is trusted
+FAILURE_PENALTY = 10.0                                                                                  # seconds a failed request counts as, so a failing provider isn't the primary
+HEDGE_QUANTILE  = 0.9                                                                                   # the primary's latency quantile after which a request is hedged
+HEDGE_DEFAULT   = 1.0                                                                                   # seconds before hedging, until the primary has enough requests
+HEDGE_MIN       = 0.25                                                                                  # never hedge sooner than this, or every request would go out twice
+HEDGE_MAX       = 2.0                                                                                   # nor later than this, or there'd be no point
+REQUEST_TIMEOUT = 10                                                                                    # seconds before a blocking request gives up
+
+
+###### PROVIDERS #################################################
+class Provider:
+    '''
+    A weather API and how fast it's been lately.
+
+    name: name of the API in the scheduler (its rate limit)
+    url: URL template taking the city and the days of forecast
+    max_days: most days of forecast the API gives
+    read: function reading the API's JSON response into a forecast_model.Forecast
+    timezones: whether its forecasts say the city's time zone
+    '''
+    def __init__(self, name:str, url:str, max_days:int, read, timezones:bool=True) -> None:
+        self.name       = name
+        self.url        = url
+        self.max_days   = max_days
+        self.read       = read
+        self.timezones  = timezones
+        self.requests   = 0
+        self.errors     = 0
+        self.wins       = 0                                                                             # requests it answered as the hedge, before the primary
+        self.latencies  = deque(maxlen=LATENCY_WINDOW)                                                  # seconds of the last requests, failures count as FAILURE_PENALTY
+
+    def record(self, seconds:float) -> None:
+        self.latencies.append(seconds)
+
+    def quantile(self, q:float) -> float:
+        '''
+        Returns a quantile (0-1) of its recent latencies in seconds, or None if it hasn't had MIN_SAMPLES requests yet.
+        '''
+        if len(self.latencies) < MIN_SAMPLES:
+            return None
+
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def get_url(self, city:str, days:int) -> str:
+        return self.url.format(gazetteer.api_query(city), days)
+
+    async def fetch(self, city:str, days:int, priority=scheduler.INTERACTIVE) -> Forecast:
+        '''
+        Downloads the forecast of a city and reads it. Raises if the request fails or the response isn't a forecast.
+        '''
+        self.requests += 1
+        start = time.perf_counter()
+        try:
+            data = await fetch.get_json(self.get_url(city, days), self.name, priority)
+            forecast = self.read(data)
+        except Exception:
+            self.errors += 1
+            self.record(FAILURE_PENALTY)
+            raise
+
+        self.record(time.perf_counter() - start)
+        return forecast
+
+    def get(self, city:str, days:int) -> Forecast:
+        '''
+        Blocking version of fetch(), without the rate limits, for the command line.
+        '''
+        self.requests += 1
+        start = time.perf_counter()
+        try:
+            response = requests.get(self.get_url(city, days), timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+            forecast = self.read(response.json())
+        except Exception:
+            self.errors += 1
+            self.record(FAILURE_PENALTY)
+            raise
+
+        self.record(time.perf_counter() - start)
+        return forecast
+
+
+WEATHERAPI  = Provider('weatherapi', 'http://api.weatherapi.com/v1/forecast.json?key=b9b5e3684034451a9b5151027211308&q={}&days={}', 14, Forecast.from_weatherapi)
+WTTR        = Provider('wttr', 'https://wttr.in/{}?format=j1', 3, Forecast.from_wttr, timezones=False)
+PROVIDERS   = [WEATHERAPI, WTTR]                                                                        # in order of preference, until their latencies are known
+
+
+###### CHOOSING #################################################
+def ranked(days:int, timezone:bool=False) -> list:
+    '''
+    Returns the providers with at least that many days of forecast (and the time zone, if asked), the one with the lowest
+    median latency first. Providers without enough requests yet keep their PROVIDERS order, after the ones that have them.
+    '''
+    able = [provider for provider in PROVIDERS if provider.max_days >= days                           # only weatherapi.com has a week
+            and (provider.timezones or not timezone)] or PROVIDERS[:1]                                  # and the time zones
+
+    def typical(provider):
+        median = provider.quantile(0.5)
+        return (median is None, median or 0.0)
+
+    return sorted(able, key=typical)                                                                    # sorted() keeps the PROVIDERS order on ties
+
+def primary(days:int=1) -> Provider:
+    return ranked(days)[0]
+
+# Seconds to wait for a provider before hedging the request to the next one
+def hedge_delay(provider:Provider) -> float:
+    latency = provider.quantile(HEDGE_QUANTILE)
+    if latency is None:
+        return HEDGE_DEFAULT
+
+    return min(HEDGE_MAX, max(HEDGE_MIN, latency))
+
+
+###### FETCHING #################################################
+async def fetch_forecast(city:str, days:int, priority=scheduler.INTERACTIVE, timezone:bool=False) -> Forecast:
+    '''
+    Gets the forecast of a city from the primary provider, hedging slash commands to the next one if it's slow.
+
+    city: which city to get the forecast of
+    days: days of forecast needed
+    priority: scheduler.INTERACTIVE requests are hedged, scheduler.BATCH ones only fail over
+    timezone: only ask the providers whose forecasts have the city's time zone
+    '''
+    candidates = ranked(days, timezone)
+    if priority != scheduler.INTERACTIVE:
+        return await fail_over(candidates, city, days, priority)
+
+    delay = hedge_delay(candidates[0])
+    running = {}                                                                                        # task -> (provider, when it started)
+    first = None                                                                                        # the primary's task, every other one is a hedge or a fail over
+    error = None
+    done = None
+
+    while True:
+        if candidates:                                                                                  # the first time, after a timeout, or after a failure
+            provider = candidates.pop(0)
+            if done is not None:
+                metrics.counter('failovers_total' if done else 'hedged_requests_total', provider=provider.name).inc()
+            task = asyncio.ensure_future(provider.fetch(city, days, priority))
+            running[task] = (provider, time.perf_counter())
+            first = first or task
+
+        if not running:
+            raise error
+
+        done, _ = await asyncio.wait(running, timeout=delay if candidates else None, return_when=asyncio.FIRST_COMPLETED)
+
+        for task in done:
+            provider, started = running.pop(task)
+            if task.exception() is not None:
+                error = task.exception()
+                continue
+
+            for loser, (other, other_started) in running.items():                                      # the first good answer wins
+                loser.cancel()
+                if other_started < started:                                                             # it had been going longer than the winner took, so it's at least that slow
+                    other.record(time.perf_counter() - other_started)
+
+            if task is not first:                                                                       # a hedge (or fail over) answered first
+                provider.wins += 1
+                metrics.counter('hedges_won_total', provider=provider.name).inc()
+
+            return task.result()
+
+# Tries the providers one after the other until one of them answers
+async def fail_over(candidates:list, city:str, days:int, priority=scheduler.BATCH) -> Forecast:
+    error = None
+    for provider in candidates:
+        try:
+            return await provider.fetch(city, days, priority)
+        except Exception as e:
+            print(f'{provider.name} failed for {city}: {e!r}')
+            error = e
+
+    raise error
+
+def get_forecast(city:str, days:int) -> Forecast:
+    '''
+    Blocking version of fetch_forecast() for the command line, which fails over but doesn't hedge.
+    '''
+    error = None
+    for provider in ranked(days):
+        try:
+            return provider.get(city, days)
+        except Exception as e:
+            print(f'{provider.name} failed for {city}: {e!r}')
+            error = e
+
+    raise error
+
+
+###### STATS #################################################
+def stats() -> dict:
+    '''
+    Returns the request counts and recent latencies of every provider, and which one is the primary.
+    '''
+    return {provider.name: {
+        'primary':  provider is primary(),
+        'requests': provider.requests,
+        'errors':   provider.errors,
+        'wins':     provider.wins,
+        'p50_s':    provider.quantile(0.5),
+        'p90_s':    provider.quantile(HEDGE_QUANTILE),
+    } for provider in PROVIDERS}
+
+# The latencies of the providers and which one is the primary, read whenever the metrics are exported
+def collect_metrics() -> list:
+    found = []
+    for name, s in stats().items():
+        found += [
+            ('provider_primary',            {'provider': name}, int(s['primary'])),
+            ('provider_requests_total',     {'provider': name}, s['requests']),
+            ('provider_errors_total',       {'provider': name}, s['errors']),
+            ('provider_latency_p50_seconds', {'provider': name}, s['p50_s'] or 0.0),
+            ('provider_latency_p90_seconds', {'provider': name}, s['p90_s'] or 0.0),
+        ]
+
+    return found
+
+metrics.register_collector(collect_metrics)
@@ -22,6 +22,74 @@ def recolour(image:Image, old_colour:tuple, new_colour:tuple) -> Image:
     return image_coloured
 
 
+### Tinting by luminance (keeps antialiased and shaded pixels, works on whole batches of icons at once)
+LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)                                               # how bright each channel looks (Rec. 601)
+
+def tint_batch(icons:np.ndarray, colours, reference:tuple, out:np.ndarray=None, scratch:np.ndarray=None) -> np.ndarray:
+    '''
+    Tints a stack of RGBA icons in one vectorized pass. Every pixel gets the new colour scaled by how bright it is compared
+    to the reference colour, so pixels drawn in the reference colour become exactly the new colour, and darker edges or shading
+    become darker shades of it. Alpha is left alone.
+
+    icons: uint8 array of shape (N, height, width, 4), see stack()
+    colours: one (R, G, B) colour for all icons, or an array of shape (N, 3) with a colour per icon
+    reference: (R, G, B) colour the icons were drawn in
+    out: uint8 array shaped like icons to write the result into (can be icons itself), a new one if None
+    scratch: float32 array of shape (2, N, height, width) to use as working memory, a new one if None
+    '''
+    if out is None:
+        out = np.empty_like(icons)
+    if scratch is None:
+        scratch = np.empty((2,) + icons.shape[:3], dtype=np.float32)
+    scratch, channel = scratch                                                                          # the brightness, and the channel being written
+
+    np.multiply(icons[..., 0], LUMA[0], out=scratch)                                                    # brightness of every pixel...
+    for c in (1, 2):
+        np.multiply(icons[..., c], LUMA[c], out=channel)
+        scratch += channel
+    scratch /= float(np.dot(reference, LUMA))                                                           # ...relative to the colour the icons were drawn in
+
+    colours = np.asarray(colours, dtype=np.float32).reshape(-1, 1, 1, 3)                                # (1 or N, 1, 1, 3) so it broadcasts over the stack
+    for c in range(3):
+        np.multiply(scratch, colours[..., c], out=channel)
+        np.rint(channel, out=channel)
+        np.clip(channel, 0, 255, out=channel)
+        out[..., c] = channel                                                                           # the brightness was already read, so out can be icons
+
+    if out is not icons:
+        out[..., 3] = icons[..., 3]
+
+    return out
+
+def tint(image:Image, new_colour:tuple, reference:tuple) -> Image:
+    '''
+    Tints a single icon, see tint_batch().
+
+    image: the icon
+    new_colour: (R, G, B) colour to tint it
+    reference: (R, G, B) colour the icon was drawn in
+    '''
+    data = np.array(image.convert('RGBA'))[np.newaxis]                                                  # a stack of one
+    tint_batch(data, new_colour, reference, out=data)
+
+    return Image.fromarray(data[0])
+
+# Stacks RGBA images of slightly different sizes into one (N, height, width, 4) array, padding them with transparency
+def stack(images:list) -> np.ndarray:
+    height = max(image.height for image in images)
+    width = max(image.width for image in images)
+    data = np.zeros((len(images), height, width, 4), dtype=np.uint8)
+
+    for i, image in enumerate(images):
+        data[i, :image.height, :image.width] = np.asarray(image.convert('RGBA'))
+
+    return data
+
+# Turns a stack back into images, cropping each one back to the size it had before stack()
+def unstack(data:np.ndarray, sizes:list) -> list:
+    return [Image.fromarray(data[i, :height, :width]) for i, (width, height) in enumerate(sizes)]
+
+
 
 
 if __name__ == "__main__":
@@ -36,7 +104,4 @@ if __name__ == "__main__":
         img = Image.open(icon)
 
         new_img = recolour(img, colour_to_replace, new_colour)
-        new_img.show()
-    
-else:
-    print('RECOLOUR IMPORTED')
\ No newline at end of file
+        new_img.show()
\ No newline at end of file
@@ -0,0 +1,125 @@
+###### DESCRIPTION #################################################
+### Runs the pill card renderers in a pool of worker processes so that PIL compositing and PNG encoding
+### don't block the Discord event loop or fight over the GIL. Every worker imports pill once when it starts,
+### which loads the templates, fonts and icons, and then just renders cards and sends back the PNG bytes.
+
+
+###### IMPORTS #################################################
+import asyncio                                                                                          # awaiting the worker processes from the bot
+import os                                                                                               # counting CPU cores
+from concurrent.futures import ProcessPoolExecutor                                                      # the worker processes
+from concurrent.futures.process import BrokenProcessPool                                                # raised if a worker dies mid-render
+from io import BytesIO                                                                                  # the cards are handed back as file-like objects, same as pill does
+from card_cache import CardCache, card_key                                                              # finished cards, so repeat requests skip the render entirely
+from single_flight import SingleFlight                                                                  # identical renders requested at the same time only run once
+import resources                                                                                        # the templates, fonts and icons the workers load up front
+import encoders                                                                                         # resolving the default encoding before the job leaves this process
+import metrics                                                                                          # stage timings of the renders, and the card cache hit ratio
+import time                                                                                             # how long the renders wait for a free worker
+
+
+###### CONSTANTS #################################################
+RENDER_WORKERS = max(1, (os.cpu_count() or 2) - 1)                                                      # leaving one core free for the bot itself
+
+_pool: ProcessPoolExecutor = None                                                                       # created on first use
+CARD_CACHE = CardCache()                                                                                # cards rendered by the pool, keyed by their inputs
+RENDER_FLIGHTS = SingleFlight()                                                                         # renders in flight, keyed like the card cache
+
+
+###### WORKER SIDE #################################################
+# Runs once in every new worker process, loading the templates, fonts and icons into memory
+def _init_worker():
+    import pill                                                                                         # registers the templates, fonts and icons
+    resources.warm()                                                                                    # and loads all of them once
+
+# Does nothing, it's only submitted to get the workers spawned and initialised
+def _warm():
+    return os.getpid()
+
+# Renders a card with one of the pill functions -> (encoded image bytes, {stage: seconds} of the draw and encode stages)
+def _render(func, args:tuple, encoding) -> tuple:
+    with metrics.capture() as timings:
+        weather_card = func(*args, encoding=encoding)
+    return weather_card.getvalue(), timings
+
+
+###### POOL #################################################
+def get_pool() -> ProcessPoolExecutor:
+    '''
+    Returns the render pool, creating it the first time it's needed.
+    '''
+    global _pool
+
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS, initializer=_init_worker)
+
+    return _pool
+
+async def start():
+    '''
+    Spawns all the worker processes up front so the first few commands don't pay for loading the assets.
+    '''
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    await asyncio.gather(*[loop.run_in_executor(pool, _warm) for _ in range(RENDER_WORKERS)])
+
+def shutdown():
+    '''
+    Stops the worker processes.
+    '''
+    global _pool
+
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+
+# Renders a card in the pool and caches it
+async def _render_in_pool(key:str, func, args:tuple, encoding) -> bytes:
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+
+    try:
+        png, timings = await loop.run_in_executor(get_pool(), _render, func, args, encoding)
+
+    except BrokenProcessPool:                                                                           # a worker crashed, so start a fresh pool for the next request
+        shutdown()
+        raise
+
+    timings['pool'] = max(0.0, time.perf_counter() - start - sum(timings.values()))                     # waiting for a free worker and sending the job and card back and forth
+    metrics.record_stages(timings)
+
+    CARD_CACHE.put(key, png)
+    return png
+
+async def render(func, *args, encoding=None) -> BytesIO:
+    '''
+    Renders a card in the pool and returns it as an in-memory file, just like calling the pill function directly.
+    If the exact same card was rendered recently, it is returned from the card cache instead, and if it's being
+    rendered right now, this waits for that render instead of starting another one.
+
+    func: one of the pill.create_* functions
+    args: the arguments to call it with
+    encoding: encoders.Encoding to save the card as, encoders.DEFAULT if None
+    '''
+    encoding = encoders.resolve(encoding)                                                               # the workers might have been forked before DEFAULT was changed
+    key = card_key(func, args + (encoding.name,))
+    png = CARD_CACHE.get(key)
+
+    if png is None:
+        png = await RENDER_FLIGHTS.do(key, _render_in_pool, key, func, args, encoding)
+
+    return BytesIO(png)                                                                                 # a new file object every time, so concurrent sends don't share a file pointer
+
+# The card cache and render coalescing numbers, read whenever the metrics are exported
+def collect_metrics() -> list:
+    lookups = CARD_CACHE.hits + CARD_CACHE.misses
+    return [
+        ('card_cache_hits_total',       {}, CARD_CACHE.hits),
+        ('card_cache_misses_total',     {}, CARD_CACHE.misses),
+        ('card_cache_hit_ratio',        {}, CARD_CACHE.hits / lookups if lookups else 0.0),
+        ('card_cache_bytes',            {}, CARD_CACHE.size),
+        ('renders_coalesced_total',     {}, RENDER_FLIGHTS.coalesced),
+        ('renders_in_flight',           {}, len(RENDER_FLIGHTS)),
+    ]
+
+metrics.register_collector(collect_metrics)
@@ -0,0 +1,94 @@
+###### DESCRIPTION #################################################
+### One registry for every asset the cards need (templates, fonts, icons). Modules register a loader for each asset under
+### a name, and nothing is read from disk until the first time the asset is asked for, so importing pill or text is instant.
+### Long-running processes can warm the registry up front instead, either right away or on a background thread.
+###
+### Run this script to get a report of how long each module takes to import and each asset takes to load.
+
+
+###### IMPORTS #################################################
+import threading                                                                                        # loading assets safely from several threads, and warming in the background
+
+
+###### REGISTRY #################################################
+_loaders    = {}                                                                                        # name -> function that loads the asset
+_loaded     = {}                                                                                        # name -> the loaded asset
+_lock       = threading.RLock()                                                                         # re-entrant, so loaders can get() the assets they're made from
+
+def register(name:str, loader) -> None:
+    '''
+    Registers how to load an asset. Nothing is loaded until get() is called.
+
+    name: unique name of the asset, like 'template.hourly'
+    loader: function with no arguments that returns the loaded asset
+    '''
+    _loaders[name] = loader
+
+def get(name:str):
+    '''
+    Returns an asset, loading it the first time it's asked for.
+    '''
+    try:
+        return _loaded[name]
+    except KeyError:
+        pass
+
+    with _lock:
+        if name not in _loaded:                                                                         # another thread might have loaded it while we waited
+            _loaded[name] = _loaders[name]()
+
+    return _loaded[name]
+
+def is_loaded(name:str) -> bool:
+    return name in _loaded
+
+def names() -> list:
+    return list(_loaders)
+
+def warm(names:list=None, background:bool=False):
+    '''
+    Loads assets ahead of time.
+
+    names: which assets to load, all the registered ones by default
+    background: load them on a daemon thread and return it instead of waiting
+    '''
+    names = list(_loaders) if names is None else names
+
+    def load_all():
+        for name in names:
+            get(name)
+
+    if not background:
+        load_all()
+        return None
+
+    thread = threading.Thread(target=load_all, name='resources-warm', daemon=True)
+    thread.start()
+    return thread
+
+
+###### IMPORT TIME REPORT #################################################
+if __name__ == '__main__':
+    import subprocess
+    import sys
+    import time
+
+    MODULES = ['text', 'recolour', 'icon_atlas', 'layouts', 'pill', 'weather_report', 'render_pool', 'subscriptions']
+
+    # Each module is imported in a fresh interpreter, otherwise the ones before it would already be cached
+    print(f'{"module":<20}{"import (ms)":>12}')
+    for module in MODULES:
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True, text=True)
+        lines = [l for l in result.stderr.splitlines() if l.startswith('import time:') and l.rstrip().endswith(f'| {module}')]
+        cumulative_us = int(lines[-1].split('|')[1]) if lines else 0                                    # "import time: self [us] | cumulative | imported package"
+        print(f'{module:<20}{cumulative_us / 1000:>12.1f}')
+
+    # Then how long every asset takes to load the first time
+    import pill                                                                                         # registers the templates, fonts and icons
+    import resources                                                                                    # the registry pill used (this script runs as __main__, a different module)
+
+    print(f'\n{"asset":<28}{"load (ms)":>10}')
+    for name in resources.names():
+        start = time.perf_counter()
+        resources.get(name)
+        print(f'{name:<28}{(time.perf_counter() - start) * 1000:>10.1f}')
@@ -0,0 +1,203 @@
+###### DESCRIPTION #################################################
+### Keeps the bot within the weather APIs' quotas. Every upstream provider gets a token bucket (a steady request rate plus
+### a small burst), and requests that have to wait for a token queue up by priority, so a slash command someone is waiting
+### on always goes ahead of the daily job. The daily job also leaves a few tokens in the bucket for them.
+### When a provider answers 429 (too many requests), all of its requests pause for a while, longer every time it happens again.
+
+
+###### IMPORTS #################################################
+import asyncio
+from enum import IntEnum
+import heapq                                                                                            # the queue of waiting requests, by priority then arrival
+import itertools                                                                                        # arrival order, to break ties between equal priorities
+import time                                                                                             # monotonic clock for the buckets and the wait times
+import metrics                                                                                          # exporting the queue depths and 429s
+
+
+###### CONSTANTS #################################################
+class Priority(IntEnum):
+    INTERACTIVE = 0                                                                                     # slash commands, someone's waiting on them
+    BATCH       = 1                                                                                     # the daily job, nobody minds a few seconds
+
+INTERACTIVE = Priority.INTERACTIVE
+BATCH       = Priority.BATCH
+
+# Provider -> (requests per second, burst size)
+RATE_LIMITS = {
+    'weatherapi':   (2.0, 10),                                                                          # the free plan is ~1M calls a month, so well under that on average
+    'wttr':         (1.0, 5),                                                                           # wttr.in is a free service run by one person, so going easy on it
+}
+BATCH_RESERVE   = 2                                                                                     # tokens the batch requests leave in the bucket for interactive ones
+BACKOFF_MIN     = 1.0                                                                                   # seconds paused after the first 429 (unless the API says how long)
+BACKOFF_MAX     = 60.0                                                                                  # longest pause, the pause doubles with every 429 in a row until then
+
+
+###### TOKEN BUCKET #################################################
+class TokenBucket:
+    '''
+    rate: tokens added per second
+    capacity: max tokens kept, how big a burst can be
+    '''
+    def __init__(self, rate:float, capacity:int) -> None:
+        self.rate       = rate
+        self.capacity   = capacity
+        self.tokens     = float(capacity)
+        self.updated    = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, reserve:int=0) -> float:
+        '''
+        Returns how many seconds until a token can be taken while leaving `reserve` tokens in the bucket, 0 if right now.
+        '''
+        self.refill()
+        return max(0.0, (1 + reserve - self.tokens) / self.rate)
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+
+###### UPSTREAM #################################################
+class Upstream:
+    '''
+    The rate limit, priority queue and 429 backoff of one provider.
+
+    name: name of the provider, like 'weatherapi'
+    rate: requests per second
+    burst: requests that can go out at once after a quiet period
+    '''
+    def __init__(self, name:str, rate:float, burst:int) -> None:
+        self.name           = name
+        self.bucket         = TokenBucket(rate, burst)
+        self.paused_until   = 0.0                                                                       # monotonic time the last 429 pause ends
+        self.backoff        = 0.0                                                                       # seconds of the last 429 pause, 0 after a success
+        self.throttled      = 0                                                                         # 429 responses seen
+        self.waits          = {p: [0, 0.0, 0.0] for p in Priority}                                      # priority -> [requests, total seconds waited, longest wait]
+        self._queue         = []                                                                        # (priority, arrival, enqueued at, future) of the waiting requests
+        self._arrivals      = itertools.count()
+        self._wakeup        = None                                                                      # set when a request arrives, so the dispatcher can re-check the head of the queue
+        self._dispatcher    = None
+
+    def queue_depth(self, priority:Priority=None) -> int:
+        return sum(1 for p, _, _, future in self._queue if not future.done() and (priority is None or p == priority))
+
+    def _ready_in(self, priority:Priority) -> float:
+        reserve = BATCH_RESERVE if priority == BATCH else 0
+        return max(self.paused_until - time.monotonic(), self.bucket.wait_time(reserve))
+
+    def _record_wait(self, priority:Priority, seconds:float) -> None:
+        stats = self.waits[priority]
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+
+    async def acquire(self, priority:Priority=INTERACTIVE) -> None:
+        '''
+        Waits until a request to this provider may go out.
+        '''
+        if not self._queue and self._ready_in(priority) <= 0:                                           # nobody waiting and a token to spare
+            self.bucket.take()
+            self._record_wait(priority, 0.0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._arrivals), time.monotonic(), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()                                                              # made here so it belongs to the running event loop
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        else:
+            self._wakeup.set()
+
+        await future
+
+    async def _dispatch(self) -> None:
+        # Hands out tokens to the waiting requests, most urgent first, as fast as the bucket and any 429 pause allow
+        while self._queue:
+            priority, _, enqueued, future = self._queue[0]
+            if future.done():                                                                           # the caller gave up waiting
+                heapq.heappop(self._queue)
+                continue
+
+            delay = self._ready_in(priority)
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)                                  # woken early if something more urgent arrives
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._queue)
+            self.bucket.take()
+            self._record_wait(priority, time.monotonic() - enqueued)
+            future.set_result(None)
+
+    def throttle(self, retry_after:float=None) -> None:
+        '''
+        Pauses every request to this provider after a 429, for `retry_after` seconds if the API said so, or an exponential backoff.
+        '''
+        self.throttled += 1
+        self.backoff = min(BACKOFF_MAX, max(BACKOFF_MIN, self.backoff * 2))
+        pause = retry_after if retry_after is not None else self.backoff
+        self.paused_until = max(self.paused_until, time.monotonic() + pause)
+
+    def succeeded(self) -> None:
+        self.backoff = 0.0
+
+    def stats(self) -> dict:
+        return {
+            'queue_depth':  {p.name: self.queue_depth(p) for p in Priority},
+            'paused_for':   max(0.0, self.paused_until - time.monotonic()),
+            'throttled':    self.throttled,
+            'tokens':       round(self.bucket.tokens, 2),
+            'waits':        {p.name: {'requests': n, 'mean_s': total / n if n else 0.0, 'max_s': longest}
+                             for p, (n, total, longest) in self.waits.items()},
+        }
+
+UPSTREAMS = {name: Upstream(name, rate, burst) for name, (rate, burst) in RATE_LIMITS.items()}
+
+
+###### SCHEDULING #################################################
+async def acquire(provider:str, priority:Priority=INTERACTIVE) -> None:
+    '''
+    Waits for a provider's rate limit, see Upstream.acquire().
+    '''
+    await UPSTREAMS[provider].acquire(priority)
+
+def throttle(provider:str, retry_after:float=None) -> None:
+    UPSTREAMS[provider].throttle(retry_after)
+
+def succeeded(provider:str) -> None:
+    UPSTREAMS[provider].succeeded()
+
+def stats() -> dict:
+    '''
+    Returns the queue depths, wait times and 429 counts of every provider.
+    '''
+    return {name: upstream.stats() for name, upstream in UPSTREAMS.items()}
+
+def summary() -> str:
+    lines = []
+    for name, s in stats().items():
+        waits = ', '.join(f'{p.lower()} {w["requests"]} waited {w["mean_s"]:.2f}s avg / {w["max_s"]:.2f}s max' for p, w in s['waits'].items())
+        lines.append(f'{name}: queued {sum(s["queue_depth"].values())}, {s["throttled"]}x 429, {waits}')
+
+    return '\n'.join(lines)
+
+# Queue depths, 429s and average waits of every provider, read whenever the metrics are exported
+def collect_metrics() -> list:
+    found = []
+    for name, upstream in UPSTREAMS.items():
+        found.append(('upstream_throttled_total', {'provider': name}, upstream.throttled))
+        for p in Priority:
+            n, total, _ = upstream.waits[p]
+            labels = {'provider': name, 'priority': p.name.lower()}
+            found.append(('upstream_queue_depth', labels, upstream.queue_depth(p)))
+            found.append(('upstream_wait_seconds_avg', labels, total / n if n else 0.0))
+
+    return found
+
+metrics.register_collector(collect_metrics)
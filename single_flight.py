@@ -0,0 +1,44 @@
+###### DESCRIPTION #################################################
+### Request coalescing for the bot. When a busy channel asks for the same city a few times in the same second, only the first
+### call actually fetches or renders anything, and everyone who asks while it's still running just waits for the same result.
+### The work runs in its own task, so one of the callers timing out or being cancelled doesn't cancel it for the others.
+
+
+###### IMPORTS #################################################
+import asyncio
+
+
+###### SINGLE FLIGHT #################################################
+class SingleFlight:
+    '''
+    Runs at most one call per key at a time, sharing its result (or exception) with every caller that arrives while it's in flight.
+    '''
+    def __init__(self) -> None:
+        self.calls      = 0                                                                             # calls to do()
+        self.coalesced  = 0                                                                             # calls that joined one already in flight instead of doing the work
+        self._inflight  = {}                                                                            # key -> task doing the work
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key, func, *args):
+        '''
+        Returns the result of `await func(*args)`, or of the call already in flight for the same key.
+
+        key: hashable key of the work, calls with the same key share one result
+        func: coroutine function doing the work
+        args: the arguments to call it with
+        '''
+        self.calls += 1
+        task = self._inflight.get(key)
+
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(func(*args))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))                             # the next call after this one finishes starts fresh
+        else:
+            self.coalesced += 1
+
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {'calls': self.calls, 'coalesced': self.coalesced, 'in_flight': len(self._inflight)}
@@ -0,0 +1,159 @@
+###### DESCRIPTION #################################################
+### The daily forecast subscriptions, stored in SQLite instead of re-reading and re-writing a CSV on every command.
+### Each subscriber is one row indexed by their userID and by their (normalized) city, so adding or cancelling a subscription
+### only touches that row, and the daily job can stream through the subscribers one city at a time.
+
+
+###### IMPORTS #################################################
+import csv                                                                                              # importing the old daily_forecasts.csv
+import os                                                                                               # checking for the old CSV
+import sqlite3                                                                                          # the database itself
+from forecast_cache import normalize_city                                                               # so "cologne", "Cologne" and "Köln" end up in the same group
+import gazetteer                                                                                        # storing every city under its proper name
+
+
+###### CONSTANTS #################################################
+DAILY_DB    = 'daily_forecasts.db'                                                                      # the SQLite database file
+DAILY_CSV   = 'daily_forecasts.csv'                                                                     # the old pandas CSV, imported once when the database is created
+
+SCHEMA_VERSION = 3                                                                                      # PRAGMA user_version of a database with the current SCHEMA
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS subscriptions (
+    user_id     INTEGER PRIMARY KEY,
+    city        TEXT NOT NULL,
+    city_key    TEXT NOT NULL,
+    tz_id       TEXT
+);
+CREATE INDEX IF NOT EXISTS subscriptions_city ON subscriptions (city_key);
+'''
+
+
+###### STORE #################################################
+class SubscriptionStore:
+    '''
+    The daily forecast subscribers: one city per user.
+
+    path: SQLite database file
+    csv_path: old CSV of subscribers to import when the database is first created
+    '''
+    def __init__(self, path:str=DAILY_DB, csv_path:str=DAILY_CSV) -> None:
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')                                                      # readers don't block the writer and vice versa
+        self.db.execute('PRAGMA synchronous=NORMAL')                                                    # safe with WAL, and a lot fewer fsyncs
+
+        version = self.db.execute('PRAGMA user_version').fetchone()[0]
+        if version == 0:                                                                                # a brand new database
+            self.db.executescript(SCHEMA)
+            if csv_path and os.path.exists(csv_path):
+                self.import_csv(csv_path)
+            version = SCHEMA_VERSION                                                                    # so the CSV is only ever imported once
+        if version == 1:                                                                                # cities stored as typed, before the gazetteer
+            self.canonicalize()
+            version = 2
+        if version == 2:                                                                                # no time zones yet
+            self.db.execute('ALTER TABLE subscriptions ADD COLUMN tz_id TEXT')
+            version = 3
+
+        self.db.execute(f'PRAGMA user_version = {version}')
+
+    def __len__(self) -> int:
+        return self.db.execute('SELECT COUNT(*) FROM subscriptions').fetchone()[0]
+
+    def __contains__(self, user_id:int) -> bool:
+        return self.get(user_id) is not None
+
+    def get(self, user_id:int) -> str:
+        '''
+        Returns the city a user is subscribed to, or None.
+        '''
+        row = self.db.execute('SELECT city FROM subscriptions WHERE user_id = ?', (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def subscribe(self, user_id:int, city:str) -> None:
+        '''
+        Adds a subscriber, or changes their city if they already have one. The time zone is copied from
+        the city's other subscribers, if it's already known.
+        '''
+        key = normalize_city(city)
+        with self.db:
+            self.db.execute(
+                'INSERT INTO subscriptions (user_id, city, city_key, tz_id) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (user_id) DO UPDATE SET city = excluded.city, city_key = excluded.city_key, tz_id = excluded.tz_id',
+                (user_id, gazetteer.canonical(city), key, self.get_timezone(key))
+            )
+
+    def unsubscribe(self, user_id:int) -> bool:
+        '''
+        Removes a subscriber. Returns False if they weren't subscribed to begin with.
+        '''
+        with self.db:
+            cursor = self.db.execute('DELETE FROM subscriptions WHERE user_id = ?', (user_id,))
+        return cursor.rowcount > 0
+
+    def get_timezone(self, city_key:str) -> str:
+        '''
+        Returns the IANA time zone (like 'Europe/Berlin') of a city, or None if it isn't known yet.
+        '''
+        row = self.db.execute('SELECT tz_id FROM subscriptions WHERE city_key = ? AND tz_id IS NOT NULL LIMIT 1', (city_key,)).fetchone()
+        return row[0] if row else None
+
+    def set_timezone(self, city_key:str, tz_id:str) -> None:
+        '''
+        Sets the time zone of every subscriber of a city.
+        '''
+        with self.db:
+            self.db.execute('UPDATE subscriptions SET tz_id = ? WHERE city_key = ?', (tz_id, city_key))
+
+    def cities(self) -> list:
+        '''
+        Returns (city key, city, time zone or None) for every subscribed city.
+        '''
+        return self.db.execute('SELECT city_key, MIN(city), MAX(tz_id) FROM subscriptions GROUP BY city_key').fetchall()
+
+    def subscribers(self, city_key:str) -> list:
+        '''
+        Returns the userIDs subscribed to a city.
+        '''
+        return [row[0] for row in self.db.execute('SELECT user_id FROM subscriptions WHERE city_key = ?', (city_key,))]
+
+    def iter_by_city(self, city_keys):
+        '''
+        Yields (city, [userIDs]) for each of the city keys, with one query per city run only when it's read.
+        Cities nobody is subscribed to anymore are skipped.
+        '''
+        for city_key in city_keys:
+            rows = self.db.execute('SELECT city, user_id FROM subscriptions WHERE city_key = ?', (city_key,)).fetchall()
+            if rows:
+                yield rows[0][0], [row[1] for row in rows]
+
+    def import_csv(self, csv_path:str) -> int:
+        '''
+        Imports the subscribers from the old pandas CSV (userID,city). Returns how many rows were imported.
+        '''
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            rows = [(int(row['userID']), gazetteer.canonical(row['city']), normalize_city(row['city'])) for row in csv.DictReader(f)]
+
+        with self.db:
+            self.db.executemany(
+                'INSERT INTO subscriptions (user_id, city, city_key) VALUES (?, ?, ?) '
+                'ON CONFLICT (user_id) DO UPDATE SET city = excluded.city, city_key = excluded.city_key',
+                rows
+            )
+
+        return len(rows)
+
+    def canonicalize(self) -> int:
+        '''
+        Rewrites every stored city with its gazetteer name and key. Returns how many rows changed.
+        '''
+        rows = self.db.execute('SELECT user_id, city, city_key FROM subscriptions').fetchall()
+        changed = [(gazetteer.canonical(city), normalize_city(city), user_id) for user_id, city, key in rows
+                   if (gazetteer.canonical(city), normalize_city(city)) != (city, key)]
+
+        with self.db:
+            self.db.executemany('UPDATE subscriptions SET city = ?, city_key = ? WHERE user_id = ?', changed)
+
+        return len(changed)
+
+    def close(self) -> None:
+        self.db.close()
@@ -1,19 +1,18 @@
 ### ENUM OF AVAILABLE FONTS
 from enum import Enum
 from PIL import ImageFont
+import resources                # Registry that loads the fonts the first time they're used
 
 class Font(Enum):
-    BOLD            = ImageFont.truetype('fonts/MyriadPro-Bold.otf',       130)
-    CONDENSED       = ImageFont.truetype("fonts/MyriadPro-Cond.otf",       64)
-    BOLD_CONDENSED  = ImageFont.truetype("fonts/MyriadPro-BoldCond.otf",   72)
-    BOLD_SMALL      = ImageFont.truetype('fonts/MyriadPro-Bold.otf',       36)
-    
+    BOLD            = ('fonts/MyriadPro-Bold.otf',       130)
+    CONDENSED       = ("fonts/MyriadPro-Cond.otf",       64)
+    BOLD_CONDENSED  = ("fonts/MyriadPro-BoldCond.otf",   72)
+    BOLD_SMALL      = ('fonts/MyriadPro-Bold.otf',       36)
 
-### TEXT FORMATTING CLASS ###
-class Text:
-    def __init__(self, text, position, font, colour=(0,0,0), anchor='lm') -> None:
-        self.text       = text
-        self.position   = position
-        self.font       = font
-        self.colour     = colour
-        self.anchor     = anchor    # https://pillow.readthedocs.io/en/stable/handbook/text-anchors.html
+    # The loaded FreeType font, only read from disk the first time it's needed
+    @property
+    def font(self) -> ImageFont.FreeTypeFont:
+        return resources.get(f'font.{self.name}')
+
+for f in Font:
+    resources.register(f'font.{f.name}', lambda path=f.value[0], size=f.value[1]: ImageFont.truetype(path, size))
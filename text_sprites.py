@@ -0,0 +1,67 @@
+###### DESCRIPTION #################################################
+### Pre-rendered text, so the cards don't run FreeType on every render. Each string is rasterized once into a greyscale
+### mask and then pasted in whatever colour it needs, which looks exactly like drawing it with ImageDraw.
+### The temperatures come from a tiny range, so they are all rendered up front (see warm()), and everything else
+### (city names, dates, times) goes in a bounded LRU cache.
+
+
+###### IMPORTS #################################################
+from collections import OrderedDict                                                                     # LRU order of the other strings
+import threading                                                                                        # cards can be drawn on several threads at once (each plan keeps a canvas per thread)
+from PIL import Image, ImageDraw
+from text import Font                                                                                   # My own Enumerator of Fonts
+
+
+###### CONSTANTS #################################################
+TEMPERATURES    = [f'{t}º' for t in range(-40, 51)]                                                     # every temperature a card can realistically show
+PRESET_STYLES   = [(Font.BOLD_SMALL, 'mm'), (Font.BOLD, 'rm')]                                          # (font, anchor) of the hourly temperatures and the big temperature
+LRU_SIZE        = 512                                                                                   # max number of other strings kept
+
+_presets    = {}                                                                                        # (text, font, anchor) -> sprite, never evicted
+_lru        = OrderedDict()                                                                             # (text, font, anchor) -> sprite, least recently used first
+_lru_lock   = threading.Lock()                                                                          # guards _lru, so an eviction can't happen between a lookup and its move_to_end()
+
+
+###### SPRITES #################################################
+# Rasterizes a string into a greyscale mask -> (mask, (x, y) offset of the mask from the text's anchor point)
+def rasterize(text:str, font:Font, anchor:str) -> tuple:
+    left, top, right, bottom = font.font.getbbox(text, anchor=anchor)
+    mask = Image.new('L', (max(1, right - left), max(1, bottom - top)), 0)
+    ImageDraw.Draw(mask).text((-left, -top), text, 255, font.font, anchor)
+
+    return mask, (left, top)
+
+def sprite(text:str, font:Font, anchor:str) -> tuple:
+    '''
+    Returns the (mask, offset) of a string, rasterizing it only the first time.
+    '''
+    key = (text, font, anchor)
+
+    found = _presets.get(key)
+    if found is not None:
+        return found
+
+    with _lru_lock:
+        found = _lru.get(key)
+        if found is not None:
+            _lru.move_to_end(key)                                                                       # marking it as the most recently used
+            return found
+
+    found = rasterize(text, font, anchor)                                                               # outside the lock, so other threads aren't held up by FreeType
+
+    with _lru_lock:
+        found = _lru.setdefault(key, found)                                                             # another thread might have rasterized it in the meantime
+        while len(_lru) > LRU_SIZE:
+            _lru.popitem(last=False)
+
+    return found
+
+def warm() -> None:
+    '''
+    Rasterizes every temperature in the fonts and anchors the cards use.
+    '''
+    for font, anchor in PRESET_STYLES:
+        for temp in TEMPERATURES:
+            key = (temp, font, anchor)
+            if key not in _presets:
+                _presets[key] = rasterize(temp, font, anchor)
@@ -3,40 +3,47 @@
 
 
 ###### IMPORTS #################################################
-import requests                                                                                         # python's curl command
-from datetime import datetime                                                                           # getting current local time and checking for nighttime
+import asyncio                                                                                          # refreshing stale forecasts in the background
+from concurrent.futures import ThreadPoolExecutor                                                       # writing the disk cache off the event loop
+import providers                                                                                        # weatherapi.com and wttr.in, hedged against each other
+import scheduler                                                                                        # rate limits of the weather APIs, and which requests go first
+from forecast_cache import ForecastCache, normalize_city                                                # TTL/LRU cache so repeated requests for a city share one download
+import disk_cache                                                                                       # the last good forecasts on disk, for restarts and API outages
+from single_flight import SingleFlight                                                                  # so requests for a city that's already being downloaded wait for that download
+from popularity import Popularity                                                                       # which cities are asked for the most, to keep them warm
+import gazetteer                                                                                        # offline city index, turns "Köln" or "Colgone" into Cologne before anything is fetched
+from forecast_model import Forecast                                                                     # the parts of the weatherapi.com payload the cards use, read once per download
+from datetime import datetime, timezone                                                                 # getting current local time and checking for nighttime
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError                                                    # the city's local time at a given moment, for cards rendered ahead of time
 import pill                                                                                             # My script to create pretty weather cards c:
+import render_pool                                                                                      # process pool that renders the cards off the event loop, for the bot
+import metrics                                                                                          # timing the fetch and parse stages, and the forecast cache hit ratio
 
 
 ###### CONSTANTS #################################################
-URL         = 'https://wttr.in/{}'
-WEATHERAPI  = 'http://api.weatherapi.com/v1/forecast.json?key=b9b5e3684034451a9b5151027211308&q={}&days=3'
+FORECAST_DAYS = 3                                                                                       # days of forecast fetched by default (today, tomorrow and the day after)
 night       = datetime(1, 2, 3, hour=21, minute=0).time()
 dawn        = datetime(1, 2, 3, hour=6, minute=0).time()
-HOURS = [9, 12, 15, 18, 21, 23]                                                                         # we only want 9AM, 12PM, 3PM, 6PM, 9PM, and 12AM
 
+FORECAST_CACHE = ForecastCache()                                                                        # (days requested, Forecast) shared by every report, which all use the same weatherapi payload
+FORECAST_FLIGHTS = SingleFlight()                                                                       # weatherapi downloads in flight, by (city, days)
+POPULARITY = Popularity()                                                                               # decayed request counts of the slash commands, by city
+WARM_CITIES     = 16                                                                                    # how many of the hottest cities are kept warm
+WARM_MIN_SCORE  = 3.0                                                                                   # decayed requests a city needs before it's worth keeping warm
+WARM_AHEAD      = 90                                                                                    # seconds before its forecast expires that a hot city is refreshed
+DISK_CACHE      = None                                                                                  # disk_cache.DiskCache of the last good forecasts, see open_disk_cache()
+STALE_RETRY     = 60                                                                                    # seconds a stale forecast from disk is served before trying to refresh it again
+DISK_WRITER     = ThreadPoolExecutor(max_workers=1, thread_name_prefix='disk_cache')                    # the disk cache's commits for the bot, one at a time so they never wait on each other
+REVALIDATIONS   = set()                                                                                 # revalidate_forecast() tasks in flight, so they aren't garbage collected
+TIMEZONES       = {}                                                                                    # city key -> IANA time zone, from the last forecast that said it, for the ones that don't (wttr.in)
 
 
-###### HELPERS #################################################
-# Gets the URL to the icon from weatherapi.com and extracts only the 3 digit icon code
-def get_code_from_json(forecast) -> str:
-    code = forecast['condition']['icon'][-7:-4]
-    return code
-
-# Gets temperature forecast from weatherapi, rounds it to full digit and adds degree symbol
-def get_temp(forecast) -> str:
-    try:    temp = round(forecast['temp_c'])
-    except: temp = round(forecast['feelslike_c'])
-
-    return f'{temp}º'
 
+###### HELPERS #################################################
 # Getting the local time in datetime format
 def get_time(local_time:str):
-    try:
-        local_datetime = datetime.strptime(local_time, '%H:%M').time()
-    except:                                                                                                 # in case the localtime is something ' 1:55' with the whitespace, otherwise we get errors
-        local_datetime = datetime.strptime(local_time[1:], '%H:%M').time()
-    
+    local_datetime = datetime.strptime(local_time.strip(), '%H:%M').time()                                  # the localtime can be something like ' 1:55' with the whitespace
+
     return local_datetime
 
 # Translates minutes elapsed into corresponding X-Position in the daily timeline
@@ -48,59 +55,283 @@ def get_daily_progress(local_datetime:datetime) -> int:
 
     return progress
 
-# Getting forecasted temperature and condition at specified hours
-def get_hourly_forecast(forecast_dict:dict):    
-    temps = [get_temp(forecast_dict[x]) for x in HOURS]                                                     # getting the temperature forecast at each hour specified, rounded to full digit
-    codes = [get_code_from_json(forecast_dict[x]) for x in HOURS]                                           # getting the forecast condition code
-    codes[-1] = '999'                                                                                       # hardcoding the code at 12AM to be the Moon
+# The IANA time zone of a city, from its forecast or, when it doesn't say (wttr.in), the last one that did. None if it was never found
+def get_zone_id(city:str, forecast:Forecast) -> str:
+    return forecast.tz_id or TIMEZONES.get(normalize_city(city))
+
+# The local time (HH:MM) of the forecast's city at the `as_of` datetime (timezone aware), or right now if None.
+# The forecast can be minutes (or hours, from the disk cache) old, so its own clock is only used when the time zone isn't known.
+def get_local_time(forecast:Forecast, as_of:datetime=None, tz_id:str=None) -> str:
+    tz_id = tz_id or forecast.tz_id
+    if tz_id:
+        try:
+            return (as_of or datetime.now(timezone.utc)).astimezone(ZoneInfo(tz_id)).strftime('%H:%M')
+        except ZoneInfoNotFoundError:                                                                       # unknown time zone, so the time the API gave us will have to do
+            pass
+
+    return forecast.local_time                                                                              # the local time (without the date) when the payload was made, wttr.in doesn't say its time zone
+
+# The moment the payload was made, as a timezone aware datetime (today's date), to pass as `as_of` so a card shows the
+# payload's own clock instead of the current one. For the benchmarks and batch renders of fixtures, which shouldn't change with the hour.
+def get_payload_time(city:str, forecast:Forecast) -> datetime:
+    tz_id = get_zone_id(city, forecast)
+    try:
+        zone = ZoneInfo(tz_id) if tz_id else timezone.utc                                                   # without a time zone get_local_time() reads the payload's clock anyway
+    except ZoneInfoNotFoundError:
+        zone = timezone.utc
+
+    return datetime.combine(datetime.now(zone).date(), get_time(forecast.local_time), tzinfo=zone)
+
+###
+
+
+###### FETCHING #################################################
+# Getting the cached forecast of a city, if it was fetched recently with at least that many days
+def get_cached_forecast(city:str, days:int) -> Forecast:
+    cached = FORECAST_CACHE.get(city)
+
+    if cached is None or cached[0] < days:                                                              # a weekly forecast needs a bigger payload than the default one
+        return None
+
+    return cached[1]
+
+# Reads a weatherapi.com (or wttr.in) payload into the Forecast the cards are made from, so the payload itself can be thrown away
+def read_forecast(data:dict) -> Forecast:
+    with metrics.stage('parse'):
+        if 'current_condition' in data:
+            return Forecast.from_wttr(data)
+        return Forecast.from_weatherapi(data)
+
+# Keeps the forecasts on disk from now on, so they survive restarts and can be served while weatherapi.com is down
+def open_disk_cache(path:str=disk_cache.FORECAST_DB) -> disk_cache.DiskCache:
+    global DISK_CACHE
+    DISK_CACHE = disk_cache.DiskCache(path)
+    return DISK_CACHE
+
+# Caching a freshly downloaded forecast, in memory and (unless disk is False) on disk
+def store_forecast(city:str, days:int, forecast:Forecast, disk:bool=True) -> None:
+    FORECAST_CACHE.put(city, (days, forecast))
+    if forecast.tz_id:                                                                                  # remembered for when a failover serves wttr.in, which doesn't say
+        TIMEZONES[normalize_city(city)] = forecast.tz_id
+    if disk and DISK_CACHE is not None:
+        DISK_CACHE.put(city, days, forecast)
+
+# Non-blocking version of store_forecast() for the bot, the SQLite commit runs on DISK_WRITER instead of the event loop
+async def store_forecast_async(city:str, days:int, forecast:Forecast) -> None:
+    store_forecast(city, days, forecast, disk=False)
+    if DISK_CACHE is not None:
+        await asyncio.get_running_loop().run_in_executor(DISK_WRITER, DISK_CACHE.put, city, days, forecast)
+
+# Deletes the forecasts too old to serve from the disk cache (see disk_cache.DiskCache.compact()) on DISK_WRITER, returns how many
+async def compact_disk_cache() -> int:
+    if DISK_CACHE is None:
+        return 0
+
+    return await asyncio.get_running_loop().run_in_executor(DISK_WRITER, DISK_CACHE.compact)
 
-    return temps, codes
+def get_stored_forecast(city:str, days:int) -> tuple:
+    '''
+    Gets the last good forecast of a city from the disk cache and puts it back in memory, for as long as it has left
+    to be fresh, or STALE_RETRY seconds if it's stale. Returns (Forecast, whether it's stale), or None.
+    '''
+    stored = DISK_CACHE.get(city, days) if DISK_CACHE is not None else None
+    if stored is None:
+        return None
+
+    age, stored_days, forecast = stored
+    stale = age >= FORECAST_CACHE.ttl
+    FORECAST_CACHE.put(city, (stored_days, forecast), STALE_RETRY if stale else FORECAST_CACHE.ttl - age)
+
+    return forecast, stale
+
+# Getting the forecast for a city, from the cache if someone asked for it recently
+def get_forecast(city:str, days:int=FORECAST_DAYS) -> Forecast:
+    forecast = get_cached_forecast(city, days)
+    if forecast is not None:
+        return forecast
+
+    stored = get_stored_forecast(city, days)
+    if stored is not None and not stored[1]:                                                            # fresh enough, no need to download anything
+        return stored[0]
+
+    try:
+        with metrics.stage('fetch'):
+            forecast = providers.get_forecast(city, days)
+    except Exception as e:
+        if stored is None:
+            raise
+        print(f'Could not refresh {city}, using the forecast from disk: {e!r}')
+        return stored[0]
+
+    store_forecast(city, days, forecast)
+    return forecast
+
+# Non-blocking version of get_forecast() for the bot, where simultaneous requests for the same city share one download.
+# A stale forecast from the disk cache is served right away and refreshed in the background (stale-while-revalidate).
+async def get_forecast_async(city:str, days:int=FORECAST_DAYS, priority=scheduler.INTERACTIVE) -> Forecast:
+    forecast = get_cached_forecast(city, days)
+    if forecast is not None:
+        return forecast
+
+    stored = get_stored_forecast(city, days)
+    if stored is None:
+        return await FORECAST_FLIGHTS.do((normalize_city(city), days), download_forecast, city, days, priority)
+
+    forecast, stale = stored
+    if stale:
+        metrics.counter('forecast_stale_served_total').inc()
+        revalidation = asyncio.ensure_future(revalidate_forecast(city, days))
+        REVALIDATIONS.add(revalidation)
+        revalidation.add_done_callback(REVALIDATIONS.discard)                                           # revalidate_forecast() prints its own failures
+
+    return forecast
+
+# Downloads a stale forecast again without anyone waiting for it, the stale one keeps being served if it fails
+async def revalidate_forecast(city:str, days:int) -> None:
+    try:
+        await FORECAST_FLIGHTS.do((normalize_city(city), days), download_forecast, city, days, scheduler.BATCH)
+    except Exception as e:
+        print(f'Could not refresh {city}: {e!r}')
+
+# The IANA time zone of a city (like 'Europe/Berlin'), from its forecast
+async def get_timezone_async(city:str, priority=scheduler.INTERACTIVE) -> str:
+    forecast = await get_forecast_async(city, priority=priority)
+    if forecast.tz_id is not None:
+        return forecast.tz_id
+
+    key = normalize_city(city)
+    if key not in TIMEZONES:                                                                            # it came from wttr.in, which doesn't say, so asking the providers that do (the cached forecast stays)
+        located = await FORECAST_FLIGHTS.do((key, 'timezone'), providers.fetch_forecast, city, 1, priority, True)
+        TIMEZONES[key] = located.tz_id
 
-# Taking a YYYY-MM-DD date string and formatting it as MONTH day (AUGUST 21)
-def get_formatted_date(date_str:str) -> str:
-    date = datetime.strptime(date_str, '%Y-%m-%d')                                                          # converting the date to datetime so that we can format it differently
-    date_formatted = date.strftime('%B %d').upper()                                                         # formatting the date as AUGUST 21 (month_name day)
+    return TIMEZONES[key]
 
-    return date_formatted
+# Counts a slash command request for a city, and the card it asked for if it's worth rendering ahead (the bot's own background requests don't count)
+def record_request(city:str, priority, func=None, *args) -> None:
+    if priority == scheduler.INTERACTIVE:
+        POPULARITY.record(normalize_city(city), city, (func, args) if func is not None else None)
+
+async def warm_popular(limit:int=WARM_CITIES, min_score:float=WARM_MIN_SCORE, ahead:float=WARM_AHEAD) -> int:
+    '''
+    Refreshes the forecasts of the hottest cities shortly before they expire and renders their cards again, so popular
+    requests are served from the caches. Returns how many cities were refreshed.
+    Only the cards that don't show the current time (tomorrow and multi-day forecasts) are rendered again, the hourly and
+    simplified ones change every minute so they'd never be served from the card cache.
+
+    limit: how many of the hottest cities to look at
+    min_score: decayed requests a city needs to be kept warm
+    ahead: seconds before expiry a forecast is refreshed
+    '''
+    warmed = 0
+
+    for key, city, _, variants in POPULARITY.top(limit, min_score):
+        cached = FORECAST_CACHE.peek(city)
+        if cached is not None and cached[0] > ahead:                                                    # still fresh for a while
+            continue
+
+        days = cached[1][0] if cached is not None else FORECAST_DAYS                                   # as many days as it was last fetched with
+        try:
+            await FORECAST_FLIGHTS.do((key, days), download_forecast, city, days, scheduler.BATCH)
+            for func, args in variants:                                                                 # lands in the card cache
+                await func(city, *args, priority=scheduler.BATCH)
+            warmed += 1
+        except Exception as e:                                                                          # a hiccup with one city shouldn't stop the others
+            print(f'Could not warm {city}: {e!r}')
+
+    return warmed
+
+async def download_forecast(city:str, days:int, priority=scheduler.INTERACTIVE) -> Forecast:
+    with metrics.stage('fetch'):
+        forecast = await providers.fetch_forecast(city, days, priority)
+    await store_forecast_async(city, days, forecast)
+
+    return forecast
+
+# The forecast cache and download coalescing numbers, read whenever the metrics are exported
+def collect_metrics() -> list:
+    lookups = FORECAST_CACHE.hits + FORECAST_CACHE.misses
+    return [
+        ('forecast_cache_hits_total',       {}, FORECAST_CACHE.hits),
+        ('forecast_cache_misses_total',     {}, FORECAST_CACHE.misses),
+        ('forecast_cache_hit_ratio',        {}, FORECAST_CACHE.hits / lookups if lookups else 0.0),
+        ('forecast_cache_entries',          {}, len(FORECAST_CACHE)),
+        ('downloads_coalesced_total',       {}, FORECAST_FLIGHTS.coalesced),
+        ('downloads_in_flight',             {}, len(FORECAST_FLIGHTS)),
+    ] + ([
+        ('disk_cache_hits_total',           {}, DISK_CACHE.hits),
+        ('disk_cache_misses_total',         {}, DISK_CACHE.misses),
+        ('disk_cache_entries',              {}, len(DISK_CACHE)),
+        ('disk_cache_deleted_total',        {}, DISK_CACHE.deleted),
+    ] if DISK_CACHE is not None else [])
+
+metrics.register_collector(collect_metrics)
 
 ###
 
 
 ###### WEATHER FUNCTIONS #################################################
+# Each report is split into a fetch step (see providers, read into a forecast_model.Forecast once per download, from
+# whichever API answered first), a parse step that turns the Forecast into the arguments of a pill function, and the render
+# itself (inline, or in the render pool for the bot).
 
 ### Simplified Classic
-def weather_simplified(city:str):
+def parse_simplified(city:str, forecast:Forecast, as_of:datetime=None) -> tuple:
+    '''
+    Reads the arguments of pill.create_weather_card_simplified() from a forecast.
+
+    city: which city to get weather conditions
+    forecast: forecast_model.Forecast of the city, from either API
+    as_of: timezone aware datetime the card shows the local time of (now if None)
     '''
-    Gets only the current temperature and condition, no forecasting, using data from wttr.in
+    temperature     = f'{forecast.feels_like}°'
+    weather_code    = forecast.current_code
+    local_time      = get_time(get_local_time(forecast, as_of, get_zone_id(city, forecast))).strftime('%I:%M %p')                                    # like 02:37 PM
+
+    return city.upper(), temperature, local_time, weather_code
+
+def weather_simplified(city:str, encoding=None):
+    '''
+    Gets only the current temperature and condition, no forecasting
     
     city: which city to get weather conditions
+    encoding: encoders.Encoding to save the card as, encoders.DEFAULT if None
     '''
-    url = URL.format(city) + "?format=j1"                                                                               # wttr.in link for JSON data of the requested city
-    response = requests.get(url)                                                                                        # getting the data from the above link
-    data = response.json()                                                                                              # converting it into a dictionary
+    city = gazetteer.canonical(city)
+    forecast = get_forecast(city)                                                                                       # the same forecast as the other cards, so it's usually cached
 
-    # Extracting the data we want
-    condition       = data['current_condition'][0]
-    temperature     = condition['FeelsLikeC'] + '°'
-    weather_code    = condition['weatherCode']
-    local_time      = condition['localObsDateTime'][11:]
-    description     = condition['weatherDesc'][0]['value']
+    with metrics.stage('parse'):
+        args = parse_simplified(city, forecast)
+    return pill.create_weather_card_simplified(*args, encoding=encoding)
 
-    # Creating the weather card image
-    pill.create_weather_card_simplified(city.upper(), temperature, local_time, weather_code)
+async def weather_simplified_async(city:str, encoding=None, priority=scheduler.INTERACTIVE):
+    '''
+    Non-blocking version of weather_simplified() for the bot.
+
+    city: which city to get weather conditions
+    encoding: encoders.Encoding to save the card as, encoders.DEFAULT if None
+    priority: scheduler.BATCH for background work, so it doesn't hold up the slash commands
+    '''
+    city = gazetteer.canonical(city)
+    record_request(city, priority)                                                                      # it shows the current time, so it isn't rendered ahead
+    forecast = await get_forecast_async(city, priority=priority)
+    with metrics.stage('parse'):
+        args = parse_simplified(city, forecast)
+    return await render_pool.render(pill.create_weather_card_simplified, *args, encoding=encoding)
 
 
 ### 2.0 version with hourly forecasts
-def weather_report(city:str):
-    # Getting weather data from weatherapi.com
-    response = requests.get(WEATHERAPI.format(city))
-    data = response.json()
+def parse_weather_report(city:str, forecast:Forecast, as_of:datetime=None) -> tuple:
+    '''
+    Reads the arguments of pill.create_weather_card_hourly() from a forecast.
 
-    # Reading and formatting current values from the dictionary
-    current_data = data['current']
-    current_temp = get_temp(current_data)
-    current_code = get_code_from_json(current_data)                                                                     # current condition code
-    local_time = data['location']['localtime'][-5:]                                                                     # getting the local time (without the date)
+    city: which city to report on
+    forecast: forecast_model.Forecast of the city
+    as_of: timezone aware datetime the card will be sent at, if it's rendered ahead of time (now if None)
+    '''
+    # Current values
+    current_temp = forecast.current_temp
+    current_code = forecast.current_code                                                                                # current condition code
+    local_time = get_local_time(forecast, as_of, get_zone_id(city, forecast))                                          # getting the local time (without the date)
 
     local_datetime = get_time(local_time)                                                                               # gets the local time in datetime.time format
     
@@ -109,41 +340,127 @@ def weather_report(city:str):
         current_code = '999'
     
     # Getting the hourly forecast values
-    forecast = data['forecast']['forecastday'][0]['hour']                                                               # all hourly forecasts are children of this element
-    hours = [9, 12, 15, 18, 21, 23]                                                                                     # we only want 9AM, 12PM, 3PM, 6PM, 9PM, and 12AM
-    hourly_temp = [get_temp(forecast[x]) for x in hours]                                                                # getting the temperature forecast at each hour specified, rounded to full digit
-    hourly_code = [get_code_from_json(forecast[x]) for x in hours]                                                      # getting the forecast condition code
-    hourly_code[-1] = '999'                                                                                             # hardcoding the code at 12AM to be the Moon
+    today = forecast.days[0]
+    hourly_temp, hourly_code = list(today.hourly_temps), list(today.hourly_codes)
 
     progress = get_daily_progress(local_datetime)                                                                       # translates minutes elapsed into corresponding X-Position in the daily timeline
 
+    return city.upper(), current_temp, current_code, local_time, hourly_temp, hourly_code, progress
+
+def weather_report(city:str, encoding=None):
+    # Getting weather data from weatherapi.com
+    city = gazetteer.canonical(city)                                                                                    # the card shows the city's proper name
+    forecast = get_forecast(city)
+
     # FINALLY creates the image and saves it to memory!
-    weather_card = pill.create_weather_card_hourly(city.upper(), current_temp, current_code, local_time, hourly_temp, hourly_code, progress)
+    with metrics.stage('parse'):
+        args = parse_weather_report(city, forecast)
+    return pill.create_weather_card_hourly(*args, encoding=encoding)
 
-    return weather_card
+async def weather_report_async(city:str, encoding=None, priority=scheduler.INTERACTIVE, as_of:datetime=None):
+    '''
+    Non-blocking version of weather_report() for the bot.
+
+    city: which city to report on
+    encoding: encoders.Encoding to save the card as, encoders.DEFAULT if None
+    priority: scheduler.BATCH for the daily job, so it doesn't hold up the slash commands
+    as_of: timezone aware datetime the card will be sent at, if it's rendered ahead of time (now if None)
+    '''
+    city = gazetteer.canonical(city)
+    record_request(city, priority)                                                                      # it shows the current time, so it isn't rendered ahead
+    forecast = await get_forecast_async(city, priority=priority)
+    if as_of is not None and get_zone_id(city, forecast) is None:                                       # without the time zone the card would show the payload's clock instead of the slot's
+        try:
+            await get_timezone_async(city, priority)
+        except Exception as e:
+            print(f'Could not find the time zone of {city}: {e!r}')
+    with metrics.stage('parse'):
+        args = parse_weather_report(city, forecast, as_of)
+    return await render_pool.render(pill.create_weather_card_hourly, *args, encoding=encoding)
 
 
 ###############################
-def tomorrow(city:str, transparent:bool):
-    # Getting weather data from weatherapi.com
-    response = requests.get(WEATHERAPI.format(city))
-    data = response.json()
-
-    # Reading and formatting current values from the dictionary
-    forecast = data['forecast']['forecastday'][1]
-    avg_temp = round(forecast['day']['avgtemp_c'])                                                          # getting the average temperature forecasted, rounded
-    avg_temp = f'{avg_temp}º'                                                                               # adding the degrees symbol
-    condition_code = get_code_from_json(forecast['day'])                                                    # getting the forecasted condition code
-    
-    # Forecast date
-    date = forecast['date']                                                                                 # getting tomorrow's date string
-    date_formatted = get_formatted_date(date)
+def parse_forecast_day(day) -> tuple:
+    '''
+    Reads one day of forecast -> (average temp, condition code, formatted date, hourly temps, hourly codes)
 
-    # Getting the hourly forecast values
-    forecast_dict = forecast['hour']                                                                        # all hourly forecasts are children of this element
-    hourly_temps, hourly_codes = get_hourly_forecast(forecast_dict)
+    day: one of the forecast_model.Forecast.days
+    '''
+    return day.avg_temp, day.code, day.date, list(day.hourly_temps), list(day.hourly_codes)
+
+def parse_tomorrow(city:str, forecast:Forecast, transparent:bool) -> tuple:
+    '''
+    Reads the arguments of pill.create_tomorrow_forecast() from a forecast.
+
+    city: which city to report on
+    forecast: forecast_model.Forecast of the city
+    transparent: dark mode with a transparent background
+    '''
+    return (city.upper(),) + parse_forecast_day(forecast.days[1]) + (transparent,)                          # tomorrow
+
+def tomorrow(city:str, transparent:bool, encoding=None):
+    # Getting weather data from weatherapi.com
+    city = gazetteer.canonical(city)                                                                                    # the card shows the city's proper name
+    forecast = get_forecast(city)
 
     # Creating the weather card image
-    weather_card = pill.create_tomorrow_forecast(city.upper(), avg_temp, condition_code, date_formatted, hourly_temps, hourly_codes, transparent)
+    with metrics.stage('parse'):
+        args = parse_tomorrow(city, forecast, transparent)
+    return pill.create_tomorrow_forecast(*args, encoding=encoding)
+
+async def tomorrow_async(city:str, transparent:bool, encoding=None, priority=scheduler.INTERACTIVE):
+    '''
+    Non-blocking version of tomorrow() for the bot.
+
+    city: which city to report on
+    transparent: dark mode with a transparent background
+    encoding: encoders.Encoding to save the card as, encoders.DEFAULT if None
+    priority: scheduler.BATCH for background work, so it doesn't hold up the slash commands
+    '''
+    city = gazetteer.canonical(city)
+    record_request(city, priority, tomorrow_async, transparent, encoding)
+    forecast = await get_forecast_async(city, priority=priority)
+    with metrics.stage('parse'):
+        args = parse_tomorrow(city, forecast, transparent)
+    return await render_pool.render(pill.create_tomorrow_forecast, *args, encoding=encoding)
+
+
+###############################
+def parse_forecast_days(city:str, forecast:Forecast, period:int, transparent:bool) -> tuple:
+    '''
+    Reads the arguments of pill.create_multiday_forecast() from a forecast.
+
+    city: which city to report on
+    forecast: forecast_model.Forecast of the city
+    period: how many days to forecast, starting today (as many as the forecast has, if it has fewer)
+    transparent: dark mode with a transparent background
+    '''
+    days = [parse_forecast_day(day) for day in forecast.days[:period]]
+
+    return city.upper(), days, transparent
+
+def forecast_days(city:str, period:int, transparent:bool, encoding=None):
+    '''
+    Creates a card with one forecast panel per day, starting today, all from a single weatherapi.com payload.
+
+    city: which city to report on
+    period: how many days to forecast
+    transparent: dark mode with a transparent background
+    encoding: encoders.Encoding to save the card as, encoders.DEFAULT if None
+    '''
+    city = gazetteer.canonical(city)
+    forecast = get_forecast(city, max(period, FORECAST_DAYS))
+    with metrics.stage('parse'):
+        args = parse_forecast_days(city, forecast, period, transparent)
+    return pill.create_multiday_forecast(*args, encoding=encoding)
 
-    return weather_card
\ No newline at end of file
+async def forecast_days_async(city:str, period:int, transparent:bool, encoding=None, priority=scheduler.INTERACTIVE):
+    '''
+    Non-blocking version of forecast_days() for the bot.
+    '''
+    city = gazetteer.canonical(city)
+    record_request(city, priority, forecast_days_async, period, transparent, encoding)
+    forecast = await get_forecast_async(city, max(period, FORECAST_DAYS), priority)
+    with metrics.stage('parse'):
+        args = parse_forecast_days(city, forecast, period, transparent)
+    return await render_pool.render(pill.create_multiday_forecast, *args, encoding=encoding)